@@ -1,164 +1,107 @@
+import os
 import sys
-import pandas as pd
-import cv2
 import numpy as np
+import pandas as pd
 from PIL import Image
-from playwright.sync_api import sync_playwright
 import io
 
-# Constants for absorption rates and tree CO2 absorption
-GREEN_ABSORPTION_RATE = 22  # kg CO2 per m² per year for green areas
-WETLANDS_ABSORPTION_RATE = 5.0  # kg CO2 per m² per year for wetlands
-
-TREE_CO2_MIN = 10  # kg CO2 per tree per year (low estimate)
-TREE_CO2_MAX = 40  # kg CO2 per tree per year (high estimate)
-
-PIXEL_TO_METER_CONVERSION = 0.5  # 1 pixel = 0.5 meters (placeholder)
+# shared land-cover analysis lives at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from landcover import analysis
+from landcover.analysis import GREEN_ABSORPTION_RATE, EMPTY_RESULT, ImageDecodeError, OFFSET_CLASSES
+from landcover.capture_cache import analyze_location
 
 # Load afforestation policies data from CSV
 def load_afforestation_policies(csv_file_path):
     return pd.read_csv(csv_file_path)
 
-# Function to analyze the image for green and blue areas
-def analyze_image(image_path):
-    img = cv2.imread(image_path)
-    
-    if img is None:
-        return {
-            "green_pct": 0.0, "blue_pct": 0.0, 
-            "green_absorption": 0.0, "wetlands_absorption": 0.0, 
-            "total_absorption": 0.0, "trees_needed_min": 0, 
-            "trees_needed_max": 0
-        }
-    
-    # Convert image to RGB
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    img_np = np.array(img_rgb)
-    
-    # Define color ranges for green and blue areas (in RGB)
-    lower_green = np.array([0, 100, 0])
-    upper_green = np.array([100, 255, 100])
-    
-    lower_blue = np.array([0, 0, 100])
-    upper_blue = np.array([100, 100, 255])
-    
-    # Masking green and blue areas
-    mask_green = cv2.inRange(img_np, lower_green, upper_green)
-    mask_blue = cv2.inRange(img_np, lower_blue, upper_blue)
-    
-    total_pixels = img_np.size / 3
-    
-    green_pixels = cv2.countNonZero(mask_green)
-    blue_pixels = cv2.countNonZero(mask_blue)
-    
-    green_pct = (green_pixels / total_pixels) * 100
-    blue_pct = (blue_pixels / total_pixels) * 100
-    
-    # Real-world area conversion based on image dimensions and pixel-to-meter ratio
-    img_height, img_width, _ = img_np.shape
-    real_world_area_m2 = img_height * img_width * PIXEL_TO_METER_CONVERSION**2
-    
-    # Calculate green and blue areas in square meters
-    green_area_m2 = (green_pixels / total_pixels) * real_world_area_m2
-    blue_area_m2 = (blue_pixels / total_pixels) * real_world_area_m2
-    
-    # Calculate absorption potential
-    green_absorption = green_area_m2 * GREEN_ABSORPTION_RATE
-    wetlands_absorption = blue_area_m2 * WETLANDS_ABSORPTION_RATE
-    
-    # Total absorption is the sum of green and wetlands absorption
-    total_absorption = green_absorption + wetlands_absorption
-    
-    # Calculate the number of trees needed to offset emissions
-    trees_needed_min = total_absorption / TREE_CO2_MAX
-    trees_needed_max = total_absorption / TREE_CO2_MIN
-    
+# Function to analyze the image for green and blue areas, with this script's colour classes
+def analyze_image(image, strip_rows=None, classes=OFFSET_CLASSES, tolerance=None):
+    return analysis.analyze_image(image, strip_rows, classes, tolerance)
+
+# Index of the policy data by lower-cased state, built once instead of on every lookup
+def build_policy_index(policy_data):
     return {
-        "green_pct": green_pct,
-        "blue_pct": blue_pct,
-        "green_absorption": green_absorption,
-        "wetlands_absorption": wetlands_absorption,
-        "total_absorption": total_absorption,
-        "trees_needed_min": trees_needed_min,
-        "trees_needed_max": trees_needed_max
+        'states': {state: i for i, state in reversed(list(enumerate(policy_data['State'].str.lower())))},
+        'policy_names': policy_data['Policy Name'].to_numpy(),
+        'species': policy_data['Planting Species'].to_numpy(),
+        'target_areas': policy_data['Target Area (in hectares)'].to_numpy(),
     }
 
+# Afforestation potential and remaining gap for many (state, emission gap) pairs at once
+def evaluate_afforestation_policies(states, emission_gaps, policy_index):
+    rows = np.array([policy_index['states'].get(str(state).lower(), -1) for state in states], dtype=np.intp)
+    emission_gaps = np.asarray(emission_gaps, dtype=np.float64)
+    found = rows >= 0
+    rows = np.where(found, rows, 0)
+
+    # Placeholder: You can adjust the absorption rate based on the species if you have detailed data
+    adjusted_absorption_rate = GREEN_ABSORPTION_RATE  # This can be customized based on the species
+
+    # Use the policy's target area to calculate potential absorption
+    afforestation_potential = np.where(found, policy_index['target_areas'][rows] * 10000 * adjusted_absorption_rate,
+                                       np.nan)  # hectares to m²
+    return pd.DataFrame({
+        'state': list(states),
+        'found': found,
+        'policy_name': np.where(found, policy_index['policy_names'][rows], None),
+        'species': np.where(found, policy_index['species'][rows], None),
+        'emission_gap': emission_gaps,
+        'afforestation_potential': afforestation_potential,
+        'sufficient': found & (afforestation_potential >= emission_gaps),
+        'shortfall': np.where(found, np.maximum(emission_gaps - afforestation_potential, 0), emission_gaps),
+    })
+
 # Function to apply state-specific afforestation policy data
 def apply_afforestation_policy(state, emission_gap, policy_data):
-    state_policy = policy_data[policy_data['State'].str.lower() == state.lower()]
-    
-    if not state_policy.empty:
-        # Example: Get planting species and adjust absorption rates
-        species = state_policy['Planting Species'].values[0]
-        target_area = state_policy['Target Area (in hectares)'].values[0]
-        
-        # Placeholder: You can adjust the absorption rate based on the species if you have detailed data
-        adjusted_absorption_rate = GREEN_ABSORPTION_RATE  # This can be customized based on the species
-        
-        # Use the policy's target area to calculate potential absorption
-        afforestation_potential = target_area * 10000 * adjusted_absorption_rate  # hectares to m²
-        
-        if afforestation_potential >= emission_gap:
-            return f"State policy '{state_policy['Policy Name'].values[0]}' can absorb {afforestation_potential:.2f} kg of CO₂, which is sufficient to offset the remaining emissions."
+    # policy_data: the policies DataFrame, or its index from build_policy_index when evaluating many states
+    policy_index = policy_data if isinstance(policy_data, dict) else build_policy_index(policy_data)
+    result = evaluate_afforestation_policies([state], [emission_gap], policy_index).iloc[0]
+
+    if result['found']:
+        if result['sufficient']:
+            return f"State policy '{result['policy_name']}' can absorb {result['afforestation_potential']:.2f} kg of CO₂, which is sufficient to offset the remaining emissions."
         else:
-            return f"State policy '{state_policy['Policy Name'].values[0]}' can absorb {afforestation_potential:.2f} kg of CO₂, but additional afforestation is needed to cover the remaining gap of {emission_gap - afforestation_potential:.2f} kg."
+            return f"State policy '{result['policy_name']}' can absorb {result['afforestation_potential']:.2f} kg of CO₂, but additional afforestation is needed to cover the remaining gap of {result['shortfall']:.2f} kg."
     
     return "No specific policy found for this state."
 
 # Main function to run the image analysis and emission calculation
 def main():
     # Load afforestation policy data
-    afforestation_data = load_afforestation_policies('afforestation_policies_indian_states.csv')
-    
-    # Start Playwright and open a browser
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        
-        # Ask for the latitude and longitude inputs
-        latitude = float(input("Enter the latitude: "))
-        longitude = float(input("Enter the longitude: "))
-        state = input("Enter the state: ")
-        
-        # Load the location in Google Maps
-        page.goto(f"https://www.google.com/maps/@{latitude},{longitude},10z/data=!5m1!1e4")
-        
-        # Wait for the map to load
-        page.wait_for_selector('//*[@id="searchboxinput"]')
-        
-        # Take a screenshot of the map
-        screenshot = page.screenshot(full_page=True)
-        
-        # Save the screenshot as an image file
-        img_path = "screenshot.png"
-        with open(img_path, "wb") as f:
-            f.write(screenshot)
-        
-        # Analyze the screenshot for green and blue areas
-        results = analyze_image(img_path)
-        
-        # Input the actual CO₂ emissions
-        actual_emissions = float(input("Enter the actual CO₂ emissions (kg): "))
-        
-        # Display results for total absorption and tree requirements
-        print(f"Total CO₂ Absorption: {results['total_absorption']:.2f} kg")
-        print(f"Trees Needed: {results['trees_needed_min']:.2f} - {results['trees_needed_max']:.2f}")
-
-        # Calculate the CO₂ sink gap (difference between emissions and absorption)
-        sink_gap = actual_emissions - results['total_absorption']
-        
-        # Print CO₂ sink gap analysis
-        print(f"CO₂ Sink Gap Analysis:")
-        print(f"Total CO₂ Emissions: {actual_emissions:.2f} kg")
-        print(f"Total CO₂ Absorption: {results['total_absorption']:.2f} kg")
-        print(f"CO₂ Sink Gap: {sink_gap:.2f} kg")
-        
-        # Apply state-specific afforestation policy
-        policy_recommendation = apply_afforestation_policy(state, sink_gap, afforestation_data)
-        print(policy_recommendation)
+    afforestation_data = build_policy_index(load_afforestation_policies('afforestation_policies_indian_states.csv'))
+    
+    # Ask for the latitude and longitude inputs
+    latitude = float(input("Enter the latitude: "))
+    longitude = float(input("Enter the longitude: "))
+    state = input("Enter the state: ")
+    
+    # Capture the map and analyze it for green and blue areas; a location seen recently comes from
+    # the capture cache without opening the browser; a capture that cannot be decoded scores as zero
+    try:
+        results = analyze_location(latitude, longitude, classes=OFFSET_CLASSES)
+    except ImageDecodeError:
+        results = dict(EMPTY_RESULT)
+    
+    # Input the actual CO₂ emissions
+    actual_emissions = float(input("Enter the actual CO₂ emissions (kg): "))
+    
+    # Display results for total absorption and tree requirements
+    print(f"Total CO₂ Absorption: {results['total_absorption']:.2f} kg")
+    print(f"Trees Needed: {results['trees_needed_min']:.2f} - {results['trees_needed_max']:.2f}")
 
-        # Close the browser
-        browser.close()
+    # Calculate the CO₂ sink gap (difference between emissions and absorption)
+    sink_gap = actual_emissions - results['total_absorption']
+    
+    # Print CO₂ sink gap analysis
+    print(f"CO₂ Sink Gap Analysis:")
+    print(f"Total CO₂ Emissions: {actual_emissions:.2f} kg")
+    print(f"Total CO₂ Absorption: {results['total_absorption']:.2f} kg")
+    print(f"CO₂ Sink Gap: {sink_gap:.2f} kg")
+    
+    # Apply state-specific afforestation policy
+    policy_recommendation = apply_afforestation_policy(state, sink_gap, afforestation_data)
+    print(policy_recommendation)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,74 @@
+import math
+import os
+
+from flask import Flask, abort, jsonify, request
+
+from hydropower import DATA_PATH, StationIndex, get_station_coordinates, haversine_km, load_station_data
+
+app = Flask(__name__)
+app.config['STATION_DATA_PATH'] = os.environ.get('STATION_DATA_PATH', DATA_PATH)
+app.config['DEFAULT_RADIUS_KM'] = 400
+app.config['MAX_BATCH_SIZE'] = 10000
+
+# loaded and indexed once, then shared read-only by every request
+station_data = load_station_data(app.config['STATION_DATA_PATH'])
+station_index = StationIndex(station_data)
+station_names = station_data['Hydropower Station Name'].to_numpy()
+station_coordinates = get_station_coordinates(station_data)
+
+def get_number(value):
+    return None if value is None or math.isnan(value) else float(value)
+
+# Stations near one query {lat, lon[, radius_km][, k]}; k asks for the k nearest instead of a radius
+def find_stations(query):
+    try:
+        latitude, longitude = float(query['lat']), float(query['lon'])
+        k = int(query['k']) if query.get('k') is not None else None
+        radius_km = float(query.get('radius_km', app.config['DEFAULT_RADIUS_KM']))
+    except (KeyError, TypeError, ValueError, OverflowError):
+        abort(400, description="each query needs numeric 'lat' and 'lon', and optionally 'radius_km' or 'k'")
+    if not (math.isfinite(longitude) and -90 <= latitude <= 90):
+        abort(400, description="'lat' must be within [-90, 90] and 'lon' finite")
+    if k is not None and k < 1:
+        abort(400, description="'k' must be at least 1")
+    if not 0 <= radius_km < math.inf:
+        abort(400, description="'radius_km' must be finite and not negative")
+    if k is not None:
+        rows, distances = station_index.query_nearest(latitude, longitude, k)
+    else:
+        rows, distances = station_index.query_radius(latitude, longitude, radius_km)
+    # plain arrays rather than get_stations() so that a query costs tens of microseconds, not a DataFrame
+    hydro1, hydro2 = (haversine_km(latitude, longitude, lats[rows], lons[rows]) for lats, lons in station_coordinates)
+    return {'lat': latitude, 'lon': longitude,
+            'stations': [{'name': name, 'distance_km': get_number(distance),
+                          'distance_to_hydro1_km': get_number(d1), 'distance_to_hydro2_km': get_number(d2),
+                          'potential_mw': get_number(potential)}
+                         for name, distance, d1, d2, potential in zip(
+                             station_names[rows].tolist(), distances.tolist(), hydro1.tolist(), hydro2.tolist(),
+                             station_index.potential[rows].tolist())]}
+
+@app.route("/stations/nearby")
+def nearby_stations():
+    return jsonify(find_stations(request.args))
+
+# a single query object, a list of them, or {"queries": [...]}; batches answer with a list in the same order
+@app.route("/stations/nearby", methods=['POST'])
+def nearby_stations_batch():
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and 'queries' in body:
+        body = body['queries']
+    if isinstance(body, dict):
+        return jsonify(find_stations(body))
+    if not isinstance(body, list):
+        abort(400, description="expected a JSON query object or a list of them")
+    if len(body) > app.config['MAX_BATCH_SIZE']:
+        abort(413, description=f"at most {app.config['MAX_BATCH_SIZE']} queries per request")
+    return jsonify([find_stations(query) for query in body])
+
+@app.route("/health")
+def health():
+    return jsonify(status='ok', stations=len(station_data))
+
+if __name__ == '__main__':
+    app.run(host=os.environ.get('HYDRO_SERVICE_HOST', '127.0.0.1'), port=int(os.environ.get('HYDRO_SERVICE_PORT', 5001)),
+            threaded=True)
@@ -0,0 +1,210 @@
+from hashlib import sha1
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+EARTH_RADIUS_KM = 6371.0088  # mean Earth radius, as the haversine package uses
+
+RESERVOIR_COLUMNS = ('Lat (reservoir/dam)', 'Long (reservoir/dam)')
+STATION_COLUMNS = (('Lat (hydropower station 1)', 'Long (hydropower station 1)'),
+                   ('Lat (hydropower station 2)', 'Long (hydropower station 2)'))
+DISTANCE_COLUMNS = ('Distance_to_Hydro1_km', 'Distance_to_Hydro2_km')
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hydropower_data.csv')
+# the fields the distance and potential analysis reads
+ANALYSIS_COLUMNS = ('Hydropower Station Name',) + RESERVOIR_COLUMNS + STATION_COLUMNS[0] + STATION_COLUMNS[1] \
+    + ('WaterHeadhgt( max)', 'Res_capacityMm3')
+
+# Missing water heads take the mean head, missing capacities 0, and rows without reservoir coordinates go
+def clean_station_data(data):
+    data = data.copy()
+    data['WaterHeadhgt( max)'] = data['WaterHeadhgt( max)'].fillna(data['WaterHeadhgt( max)'].mean())
+    data['Res_capacityMm3'] = data['Res_capacityMm3'].fillna(0)
+    return data.dropna(subset=list(RESERVOIR_COLUMNS))
+
+def get_file_hash(path):
+    with open(path, 'rb') as fh:
+        return sha1(fh.read()).hexdigest()
+
+# (data, whether the cached modification time is still the CSV's), or None once the CSV's content changed
+def read_cache(cache_path, mtime, path):
+    with np.load(cache_path) as cached:
+        current = int(cached['mtime']) == mtime
+        if not current and str(cached['hash']) != get_file_hash(path):
+            return None
+        columns = cached['columns'].tolist()
+        values = {column: numbers for column, numbers in zip(cached['numeric_columns'].tolist(), cached['numeric'].T)}
+        for i, column in enumerate(columns):
+            if column not in values:
+                # text is stored as fixed-width strings with a mask of the missing entries
+                text = cached[f'text{i}'].astype(object)
+                text[cached[f'missing{i}']] = np.nan
+                values[column] = text
+        data = pd.DataFrame(values, index=cached['index'])[columns]
+        return data.astype(dict(zip(columns, cached['dtypes'].tolist()))), current
+
+def write_cache(cache_path, data, mtime, path):
+    numeric_columns = [column for column in data.columns if data[column].dtype.kind in 'biuf']
+    arrays = {'mtime': mtime, 'hash': get_file_hash(path), 'columns': np.array(list(data.columns)),
+              'dtypes': np.array([str(dtype) for dtype in data.dtypes]), 'index': data.index.to_numpy(),
+              'numeric_columns': np.array(numeric_columns, dtype=str),
+              'numeric': data[numeric_columns].to_numpy(dtype=np.float64).reshape(len(data), len(numeric_columns))}
+    for i, column in enumerate(data.columns):
+        if column not in numeric_columns:
+            missing = data[column].isna().to_numpy()
+            arrays[f'text{i}'] = np.where(missing, '', data[column].to_numpy(dtype=object)).astype(str)
+            arrays[f'missing{i}'] = missing
+    tmp = f"{cache_path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, **arrays)
+    os.replace(tmp, cache_path)
+
+# The cleaned station data with only `columns`. The first load reads the CSV and caches the result next
+# to it as plain arrays, later loads read only the cache until the CSV's modification time and content
+# hash change.
+def load_station_data(path=DATA_PATH, columns=ANALYSIS_COLUMNS):
+    key = sha1(repr(tuple(columns)).encode()).hexdigest()[:10]
+    cache_path = f"{os.path.splitext(path)[0]}.{key}.npz"
+    mtime = os.stat(path).st_mtime_ns
+    try:
+        cached = read_cache(cache_path, mtime, path)
+    except (OSError, KeyError, ValueError):
+        cached = None
+    if cached is not None and cached[1]:
+        return cached[0]
+    if cached is not None:
+        # only the modification time changed (a touch or a checkout); the cache is stored again with the
+        # new one so that later loads skip hashing the CSV
+        data = cached[0]
+    else:
+        data = clean_station_data(pd.read_csv(path, usecols=list(columns))[list(columns)])
+    try:
+        write_cache(cache_path, data, mtime, path)
+    except OSError:
+        # a read-only checkout just reads the CSV every time
+        pass
+    return data
+
+# Great-circle distance in km between points given in degrees; the arguments broadcast against each other
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    d = np.sin((lat2 - lat1) * 0.5) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) * 0.5) ** 2
+    return EARTH_RADIUS_KM * (2 * np.arcsin(np.sqrt(d)))
+
+# N queries x M points distance matrix
+def get_distance_matrix(query_lats, query_lons, lats, lons):
+    query_lats, query_lons = np.asarray(query_lats, dtype=np.float64), np.asarray(query_lons, dtype=np.float64)
+    return haversine_km(query_lats[:, None], query_lons[:, None], np.asarray(lats)[None, :], np.asarray(lons)[None, :])
+
+# Coordinates of hydropower station 1 and 2 of every row, NaN where the row has no reservoir coordinates
+def get_station_coordinates(data):
+    has_reservoir = data[RESERVOIR_COLUMNS[0]].notna().to_numpy() & data[RESERVOIR_COLUMNS[1]].notna().to_numpy()
+    return [(np.where(has_reservoir, data[lat].to_numpy(dtype=np.float64), np.nan),
+             np.where(has_reservoir, data[lon].to_numpy(dtype=np.float64), np.nan)) for lat, lon in STATION_COLUMNS]
+
+# Distances from one location to station 1 and 2 of every row, NaN where coordinates are missing
+def get_station_distances(data, latitude, longitude):
+    return [haversine_km(latitude, longitude, lats, lons) for lats, lons in get_station_coordinates(data)]
+
+# Potential hydropower of every row in MW, 40% of what the reservoir could give over the maximum head
+def get_hydropower_potential(data, gravity=9.81, efficiency=0.9, share=0.4):
+    water_head = data['WaterHeadhgt( max)'].to_numpy(dtype=np.float64)
+    reservoir_capacity = data['Res_capacityMm3'].to_numpy(dtype=np.float64) * 1e6  # Convert Mm³ to m³
+    conversion_factor = 1e6  # Convert to MW
+    return (reservoir_capacity * water_head * efficiency * gravity) / conversion_factor * share
+
+# Rows with station 1 or 2 within distance_threshold_km, with their distances and potential
+def find_nearby_stations(data, latitude, longitude, distance_threshold_km):
+    data = data.copy()
+    distances = get_station_distances(data, latitude, longitude)
+    for column, distance in zip(DISTANCE_COLUMNS, distances):
+        data[column] = distance
+    nearby_stations = data[(distances[0] <= distance_threshold_km) | (distances[1] <= distance_threshold_km)].copy()
+    nearby_stations['Hydropower_Potential_MW'] = get_hydropower_potential(nearby_stations)
+    return nearby_stations
+
+# Stations bucketed in cell_deg x cell_deg latitude/longitude cells. A query only measures the stations
+# in the cells overlapping the bounding box of its search circle, so its cost follows the stations
+# nearby rather than all of them. Stations 1 and 2 of a row are both indexed and a row's distance
+# is that of its nearer station.
+class StationIndex:
+    def __init__(self, data, cell_deg=1.0):
+        self.data = data
+        self.cell_deg = cell_deg
+        self.lon_cells = math.ceil(360 / cell_deg)
+        self.potential = get_hydropower_potential(data)
+        lats, lons, rows = [], [], []
+        for station_lats, station_lons in get_station_coordinates(data):
+            known = ~np.isnan(station_lats) & ~np.isnan(station_lons)
+            lats.append(station_lats[known])
+            lons.append(station_lons[known])
+            rows.append(np.flatnonzero(known))
+        lats, lons, rows = np.concatenate(lats), np.concatenate(lons), np.concatenate(rows)
+        cells = self.__get_cells(lats, lons)
+        order = np.lexsort((cells[1], cells[0]))
+        self.lats, self.lons, self.rows = lats[order], lons[order], rows[order]
+        # (lat cell, lon cell) -> slice of the sorted stations
+        self.cells = {}
+        keys = list(zip(cells[0][order].tolist(), cells[1][order].tolist()))
+        start = 0
+        for i in range(1, len(keys) + 1):
+            if i == len(keys) or keys[i] != keys[start]:
+                self.cells[keys[start]] = slice(start, i)
+                start = i
+
+    def __get_cells(self, lats, lons):
+        return (np.floor((np.asarray(lats) + 90) / self.cell_deg).astype(np.int64),
+                np.floor((np.asarray(lons) + 180) / self.cell_deg).astype(np.int64) % self.lon_cells)
+
+    def __get_candidates(self, latitude, longitude, radius_km):
+        # stations in the cells overlapping the bounding box of the search circle
+        angle = radius_km / EARTH_RADIUS_KM
+        lat_low, lat_high = latitude - math.degrees(angle), latitude + math.degrees(angle)
+        if lat_low <= -90 or lat_high >= 90 or angle >= math.pi / 2:
+            lon_cells = range(self.lon_cells)
+        else:
+            half_width = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(latitude)))))
+            first = math.floor((longitude - half_width + 180) / self.cell_deg)
+            last = math.floor((longitude + half_width + 180) / self.cell_deg)
+            lon_cells = range(self.lon_cells) if last - first + 1 >= self.lon_cells \
+                else [j % self.lon_cells for j in range(first, last + 1)]
+        first = max(0, math.floor((lat_low + 90) / self.cell_deg))
+        last = math.floor((min(lat_high, 90) + 90) / self.cell_deg)
+        slices = [self.cells[key] for key in ((i, j) for i in range(first, last + 1) for j in lon_cells)
+                  if key in self.cells]
+        if not slices:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([np.arange(s.start, s.stop) for s in slices])
+
+    def __get_rows(self, latitude, longitude, candidates):
+        # rows of the candidate stations with the distance of their nearer station, nearest first
+        distances = haversine_km(latitude, longitude, self.lats[candidates], self.lons[candidates])
+        order = np.lexsort((self.rows[candidates], distances))
+        rows, distances = self.rows[candidates][order], distances[order]
+        rows, first = np.unique(rows, return_index=True)
+        nearest = np.argsort(first, kind='stable')
+        return rows[nearest], distances[first][nearest]
+
+    def query_radius(self, latitude, longitude, radius_km):
+        # positions in `data` of the rows with a station within radius_km, and their distances, nearest first
+        rows, distances = self.__get_rows(latitude, longitude, self.__get_candidates(latitude, longitude, radius_km))
+        within = distances <= radius_km
+        return rows[within], distances[within]
+
+    def query_nearest(self, latitude, longitude, k=5):
+        # the k rows with the nearest stations, nearest first
+        radius_km = self.cell_deg * math.pi / 180 * EARTH_RADIUS_KM
+        while True:
+            rows, distances = self.query_radius(latitude, longitude, radius_km)
+            if len(rows) >= k or radius_km >= math.pi * EARTH_RADIUS_KM:
+                return rows[:k], distances[:k]
+            radius_km *= 2
+
+    def get_stations(self, rows, latitude, longitude):
+        # the rows as a DataFrame with the distance to both stations and their potential
+        stations = self.data.iloc[rows].copy()
+        for column, distance in zip(DISTANCE_COLUMNS, get_station_distances(stations, latitude, longitude)):
+            stations[column] = distance
+        stations['Hydropower_Potential_MW'] = self.potential[rows]
+        return stations
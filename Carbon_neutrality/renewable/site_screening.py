@@ -0,0 +1,172 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from hydropower import DATA_PATH, StationIndex, get_station_coordinates, haversine_km, load_station_data
+
+STATION_FIELDS = ['station_name', 'distance_km', 'distance_to_hydro1_km', 'distance_to_hydro2_km',
+                  'hydropower_potential_mw']
+
+# per worker process, loaded once by init_worker
+station_index = None
+station_names = None
+station_coordinates = None
+
+def init_worker(data_path):
+    global station_index, station_names, station_coordinates
+    data = load_station_data(data_path)
+    station_index = StationIndex(data)
+    station_names = data['Hydropower Station Name'].to_numpy()
+    station_coordinates = get_station_coordinates(data)
+
+# One output row per (site, nearby station), nearest first, and one row with empty station fields for a
+# site with none. Returns the chunk number, its rows already rendered as CSV and its number of sites.
+def screen_chunk(chunk_no, sites, lat_column, lon_column, radius_km=None, k=None):
+    latitudes = pd.to_numeric(sites[lat_column], errors='coerce').to_numpy(dtype=np.float64)
+    longitudes = pd.to_numeric(sites[lon_column], errors='coerce').to_numpy(dtype=np.float64)
+    # like hydro_service, a site off the globe has no stations rather than failing the chunk
+    valid = (np.abs(latitudes) <= 90) & np.isfinite(longitudes)
+    latitudes, longitudes = np.where(valid, latitudes, np.nan), np.where(valid, longitudes, np.nan)
+    site_rows, station_rows, distances = [], [], []
+    for i, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+        if np.isnan(latitude) or np.isnan(longitude):
+            rows, site_distances = np.zeros(0, dtype=np.int64), np.zeros(0)
+        elif k is not None:
+            rows, site_distances = station_index.query_nearest(latitude, longitude, k)
+        else:
+            rows, site_distances = station_index.query_radius(latitude, longitude, radius_km)
+        if not len(rows):
+            # -1 marks a site without stations
+            rows, site_distances = np.array([-1]), np.array([np.nan])
+        site_rows.append(np.full(len(rows), i))
+        station_rows.append(rows)
+        distances.append(site_distances)
+    site_rows, station_rows = np.concatenate(site_rows), np.concatenate(station_rows)
+    found = station_rows >= 0
+    rows = np.where(found, station_rows, 0)
+    hydro1, hydro2 = (np.where(found, haversine_km(latitudes[site_rows], longitudes[site_rows], lats[rows], lons[rows]),
+                               np.nan) for lats, lons in station_coordinates)
+    results = sites.iloc[site_rows].copy()
+    results['station_name'] = np.where(found, station_names[rows], None)
+    results['distance_km'] = np.concatenate(distances)
+    results['distance_to_hydro1_km'] = hydro1
+    results['distance_to_hydro2_km'] = hydro2
+    results['hydropower_potential_mw'] = np.where(found, station_index.potential[rows], np.nan)
+    return chunk_no, results.to_csv(header=False), len(sites)
+
+def get_header(input_path, lat_column, lon_column):
+    columns = list(pd.read_csv(input_path, nrows=0).columns)
+    for column in (lat_column, lon_column):
+        if column not in columns:
+            raise ValueError(f"{input_path} has no '{column}' column")
+    return ','.join(['site_index'] + columns + STATION_FIELDS) + '\n'
+
+def load_checkpoint(path, settings):
+    # the last chunk written and the output size after it, for the same input and settings only
+    try:
+        with open(path) as fh:
+            checkpoint = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return checkpoint if checkpoint.get('settings') == settings else None
+
+def save_checkpoint(path, settings, chunk_no, size, sites):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as fh:
+        json.dump({'settings': settings, 'chunk': chunk_no, 'bytes': size, 'sites': sites}, fh)
+    os.replace(tmp, path)
+
+# Screens every site of input_path against the stations, `chunk_size` sites at a time on a pool of
+# `workers` processes with at most 2*workers chunks in flight, so memory stays bounded by the chunks in
+# flight. Results are appended to output_path in input order and a checkpoint is saved after each
+# chunk; running again with the same settings resumes after the last completed chunk.
+def screen_sites(input_path, output_path, radius_km=400, k=None, chunk_size=1000, workers=None,
+                 lat_column='lat', lon_column='lon', data_path=DATA_PATH, verbose=1):
+    workers = workers or os.cpu_count()
+    checkpoint_path = output_path + '.checkpoint'
+    settings = {'input': os.path.abspath(input_path), 'mtime': os.stat(input_path).st_mtime_ns,
+                'radius_km': radius_km, 'k': k, 'chunk_size': chunk_size, 'lat_column': lat_column,
+                'lon_column': lon_column, 'data': os.path.abspath(data_path)}
+    checkpoint = load_checkpoint(checkpoint_path, settings)
+    header = get_header(input_path, lat_column, lon_column)
+    if checkpoint is not None and os.path.exists(output_path):
+        # drop whatever a crashed run wrote after its last checkpoint
+        with open(output_path, 'r+b') as fh:
+            fh.truncate(checkpoint['bytes'])
+        done_chunks, done_sites = checkpoint['chunk'] + 1, checkpoint['sites']
+    else:
+        with open(output_path, 'w', newline='') as fh:
+            fh.write(header)
+        done_chunks, done_sites = 0, 0
+
+    start = time.perf_counter()
+    new_sites = 0
+    chunks = pd.read_csv(input_path, chunksize=chunk_size, skiprows=range(1, done_chunks*chunk_size + 1))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(data_path,)) as executor, \
+            open(output_path, 'a', newline='') as out:
+        pending, finished = set(), {}
+        next_chunk = done_chunks
+
+        def write_finished():
+            nonlocal next_chunk, done_sites, new_sites
+            # chunks complete out of order, they are written in order
+            while next_chunk in finished:
+                text, sites = finished.pop(next_chunk)
+                out.write(text)
+                out.flush()
+                done_sites += sites
+                new_sites += sites
+                save_checkpoint(checkpoint_path, settings, next_chunk, out.tell(), done_sites)
+                next_chunk += 1
+            if verbose:
+                elapsed = time.perf_counter() - start
+                print(f"{done_sites} sites screened, {new_sites/elapsed if elapsed else 0:.0f} sites/s", end='\r',
+                      file=sys.stderr)
+
+        def collect(return_when):
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                chunk_no, text, sites = future.result()
+                finished[chunk_no] = (text, sites)
+            write_finished()
+
+        for chunk_no, sites in enumerate(chunks, start=done_chunks):
+            sites.index = sites.index + done_chunks*chunk_size
+            pending.add(executor.submit(screen_chunk, chunk_no, sites, lat_column, lon_column,
+                                        None if k is not None else radius_km, k))
+            while len(pending) + len(finished) >= 2*workers:
+                collect(FIRST_COMPLETED)
+        while pending:
+            collect(FIRST_COMPLETED)
+    if verbose:
+        print(file=sys.stderr)
+    return done_sites
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Screen candidate mine sites for nearby hydropower stations.")
+    parser.add_argument('sites', help="CSV of candidate sites with latitude and longitude columns")
+    parser.add_argument('--output', default='site_screening.csv')
+    parser.add_argument('--radius-km', type=float, default=400)
+    parser.add_argument('--k', type=int, default=None, help="the k nearest stations instead of a radius")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--lat-column', default='lat')
+    parser.add_argument('--lon-column', default='lon')
+    parser.add_argument('--data', default=DATA_PATH, help="hydropower station CSV")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = get_args(argv)
+    sites = screen_sites(args.sites, args.output, args.radius_km, args.k, args.chunk_size, args.workers,
+                         args.lat_column, args.lon_column, args.data)
+    print(f"{sites} sites screened, results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
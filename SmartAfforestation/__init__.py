@@ -1,7 +1,72 @@
-from flask import Flask, render_template, request, redirect, url_for
-from SmartAfforestation.smart_afforestation import TreePlanterGA
+import atexit
+import json
+import os
+from threading import Lock
+
+from flask import Flask, Response, abort, jsonify, render_template, request, redirect, url_for
+from SmartAfforestation.jobs import JobQueue
+from SmartAfforestation.result_cache import ResultCache
+from SmartAfforestation.smart_afforestation import TreePlanterGA, get_search_pool
 
 app = Flask(__name__)
+# best solutions of earlier requests; set RESULT_CACHE_PATH to keep them across restarts
+app.config['RESULT_CACHE_SIZE'] = 1024
+app.config['RESULT_CACHE_PATH'] = os.environ.get('RESULT_CACHE_PATH')
+result_cache = ResultCache(app.config['RESULT_CACHE_SIZE'], app.config['RESULT_CACHE_PATH'])
+# searches submitted through /jobs run in the background on this many workers
+app.config['SEARCH_WORKERS'] = 2
+job_queue = JobQueue(app.config['SEARCH_WORKERS'])
+# island searches of every request share one long-lived pool of this many worker processes
+app.config['SEARCH_PROCESSES'] = os.cpu_count()
+_search_pool = None
+_search_pool_lock = Lock()
+
+def get_shared_search_pool():
+    # started with the first search and closed at exit
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = get_search_pool(app.config['SEARCH_PROCESSES'])
+            atexit.register(_search_pool.shutdown)
+        return _search_pool
+
+# smallest value of every search parameter
+PARAM_MINIMUMS = {'AQI': 0, 'area': 0, 'cost': 0, 'population': 1, 'runtime': 1}
+
+def get_params(data):
+    # raises ValueError naming the first parameter that is missing, not a whole number or too small
+    params = {}
+    for name, minimum in PARAM_MINIMUMS.items():
+        try:
+            params[name] = int(data.get(name))
+        except (TypeError, ValueError):
+            raise ValueError(f"'{name}' must be a whole number") from None
+        if params[name] < minimum:
+            raise ValueError(f"'{name}' must be at least {minimum}")
+    return params
+
+def find_plantation(params, on_generation=None):
+    AQI, area_lt, cost_lt = params['AQI'], params['area'], params['cost']
+    population, runtime = params['population'], params['runtime']
+    # smart planter agent
+    agent = TreePlanterGA(AQI, area_lt, cost_lt, population, encoding='count')
+    key = ResultCache.get_key(agent.Zone, area_lt, cost_lt, population)
+    cached = result_cache.get(key)
+    if cached is not None:
+        agent.warm_start(cached['counts'], cached['optimal'])
+    # a cached answer is reused as is once it is optimal or was searched at least this long
+    if cached is None or not (cached['optimal'] or cached['runtime'] >= runtime):
+        print("processing request...")
+        agent.run_search(runtime=runtime, verbose=0, evaluation='batch', engine='auto',
+                         islands=app.config['SEARCH_ISLANDS'], on_generation=on_generation,
+                         patience=app.config['SEARCH_PATIENCE'], pool=get_shared_search_pool())
+        result_cache.put(key, agent.get_tree_counts(agent.best_chromosome), agent.best_fit, runtime,
+                         agent.is_optimal)
+    result = agent.get_results()
+    # context of result.html
+    return dict(trees=result['trees'], score=result['score'], area_used=result['area'], cost_used=result['cost'],
+                population=population, AQI=AQI, level=agent.Level, area_limit=area_lt, cost_limit=cost_lt,
+                tree_data=agent.tree_data, total_trees=sum(result['trees'].values()))
 
 @app.route("/", methods=['GET', 'POST'])
 def home():
@@ -14,20 +79,63 @@ def show_result():
     data = request.form
     if not data:
         return redirect(url_for('home'))
-    AQI = int(data.get('AQI'))
-    area_lt = int(data.get('area'))
-    cost_lt = int(data.get('cost'))
-    population = int(data.get('population'))
-    runtime = int(data.get('runtime'))
-    # smart planter agent
-    agent = TreePlanterGA(AQI, area_lt, cost_lt, population)
-    print("processing request...")
-    agent.run_search(runtime=runtime, verbose=0)
-    result = agent.get_results()
-    return render_template('result.html', trees=result['trees'], score=result['score'],
-                            area_used=result['area'], cost_used=result['cost'], population=population, AQI=AQI, 
-                            level=agent.Level, area_limit=area_lt, cost_limit=cost_lt, tree_data = agent.tree_data,
-                            total_trees=sum(result['trees'].values()))
+    try:
+        params = get_params(data)
+    except ValueError as e:
+        abort(400, description=str(e))
+    return render_template('result.html', **find_plantation(params))
+
+@app.route("/jobs", methods=['POST'])
+def submit_job():
+    try:
+        params = get_params(request.form)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    job = job_queue.submit(find_plantation, params)
+    return jsonify(id=job.id, status_url=url_for('job_status', job_id=job.id),
+                   events_url=url_for('job_events', job_id=job.id),
+                   result_url=url_for('job_result', job_id=job.id)), 202
+
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    return jsonify(get_job(job_id).get_state(request.args.get('since', 0, type=int)))
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = get_job(job_id)
+
+    def stream():
+        # server-sent events: new progress as it arrives, a heartbeat every 15 s otherwise
+        since = 0
+        while True:
+            job.wait(since, timeout=15)
+            state = job.get_state(since)
+            since += len(state['progress'])
+            yield f"data: {json.dumps(state)}\n\n"
+            if state['status'] in ('done', 'failed'):
+                return
+
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = get_job(job_id)
+    if job.status == 'failed':
+        return jsonify(job.get_state()), 500
+    if job.status != 'done':
+        return jsonify(job.get_state()), 202
+    return render_template('result.html', **job.result)
 
 app.config['TEMPLATES_AUTO_RELOAD'] = True
+# islands per search of problems too large to solve exactly, so that concurrent searches together
+# keep the shared pool busy without queueing behind each other
+app.config['SEARCH_ISLANDS'] = max(1, app.config['SEARCH_PROCESSES']//app.config['SEARCH_WORKERS'])
+# generations without improvement before a search gives up early
+app.config['SEARCH_PATIENCE'] = 2000
 # app.run(debug=True)
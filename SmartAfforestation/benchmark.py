@@ -0,0 +1,112 @@
+import argparse
+from itertools import product
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from SmartAfforestation.smart_afforestation import TreePlanterGA
+
+# an AQI inside each zone of TreePlanterGA.get_aqi_range
+ZONE_AQI = {'Zone I': 350, 'Zone II': 250, 'Zone III': 150, 'Zone IV': 50}
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def get_best_known(AQI, area_limit, cost_limit, population):
+    # the exact engine gives the optimum, or its best incumbent when it runs out of nodes
+    agent = TreePlanterGA(AQI, area_limit, cost_limit, population, encoding='count')
+    agent.run_search(verbose=0, engine='exact')
+    return agent.best_fit, agent.is_optimal
+
+def run_case(case, args, seed):
+    AQI, area_limit, cost_limit, population, chromosomes = case
+    best_known, optimal = get_best_known(AQI, area_limit, cost_limit, population)
+
+    # timed search, recording every improvement of the best fitness
+    random.seed(seed)
+    trace = []
+    generations = 0
+
+    def on_generation(generation, best_fit):
+        nonlocal generations
+        generations += 1
+        if not trace or best_fit > trace[-1][1]:
+            trace.append((time.perf_counter() - start, best_fit))
+
+    start = time.perf_counter()
+    agent = TreePlanterGA(AQI, area_limit, cost_limit, population, chromosomes, encoding=args.encoding)
+    setup = time.perf_counter() - start
+    agent.run_search(runtime=args.runtime, verbose=0, evaluation=args.evaluation, engine=args.engine,
+                     islands=args.islands, on_generation=on_generation)
+    elapsed = time.perf_counter() - start
+
+    time_to = {}
+    for pct in args.targets:
+        hits = [t for t, fit in trace if best_known > 0 and fit >= best_known*pct/100]
+        time_to[str(pct)] = hits[0] if hits else None
+
+    # separate, shorter pass for memory since tracemalloc slows the search down
+    random.seed(seed)
+    tracemalloc.start()
+    agent = TreePlanterGA(AQI, area_limit, cost_limit, population, chromosomes, encoding=args.encoding)
+    agent.run_search(runtime=min(args.runtime, args.memory_runtime), verbose=0, evaluation=args.evaluation,
+                     engine=args.engine, islands=args.islands)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {'zone': TreePlanterGA.get_aqi_range(AQI)[1], 'AQI': AQI, 'area_limit': area_limit,
+            'cost_limit': cost_limit, 'population': population, 'no_of_chromosomes': chromosomes, 'seed': seed,
+            'setup_s': setup, 'elapsed_s': elapsed, 'generations': generations,
+            'generations_per_s': generations/elapsed if elapsed else None, 'best_fit': trace[-1][1] if trace else None,
+            'best_known': best_known, 'best_known_optimal': optimal, 'time_to_pct_s': time_to,
+            'trace': trace, 'peak_memory_bytes': peak_memory}
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark TreePlanterGA over a grid of problems.")
+    parser.add_argument('--zones', nargs='+', default=list(ZONE_AQI), choices=list(ZONE_AQI))
+    parser.add_argument('--budgets', nargs='+', default=['2000:200000', '10000:1000000'],
+                        help="area_limit:cost_limit pairs")
+    parser.add_argument('--populations', nargs='+', type=int, default=[1000])
+    parser.add_argument('--chromosomes', nargs='+', type=int, default=[20])
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--runtime', type=float, default=5)
+    parser.add_argument('--memory-runtime', type=float, default=1,
+                        help="seconds of the separate peak-memory pass")
+    parser.add_argument('--encoding', default='count', choices=['binary', 'count'])
+    parser.add_argument('--evaluation', default='batch', choices=['threads', 'batch', 'delta'])
+    parser.add_argument('--engine', default='ga', choices=['ga', 'exact', 'auto', 'islands'])
+    parser.add_argument('--islands', type=int, default=None)
+    parser.add_argument('--targets', nargs='+', type=float, default=[90, 95, 99],
+                        help="report the time to reach these percentages of the best-known optimum")
+    parser.add_argument('--output', default='benchmark_results.json')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = get_args(argv)
+    budgets = [tuple(int(v) for v in b.split(':')) for b in args.budgets]
+    runs = []
+    for zone, (area_limit, cost_limit), population, chromosomes, seed in product(
+            args.zones, budgets, args.populations, args.chromosomes, args.seeds):
+        run = run_case((ZONE_AQI[zone], area_limit, cost_limit, population, chromosomes), args, seed)
+        print(f"{zone} area={area_limit} cost={cost_limit} population={population} chromosomes={chromosomes} "
+              f"seed={seed}: {run['generations_per_s']:.0f} gen/s, best {run['best_fit']} / {run['best_known']}")
+        runs.append(run)
+
+    report = {'commit': get_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+              'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.platform(),
+              'args': vars(args), 'runs': runs}
+    with open(args.output, 'w') as fh:
+        json.dump(report, fh, indent=2)
+    print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock
+import uuid
+
+class SearchJob:
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.status = 'queued'
+        self.error = None
+        self.result = None
+        self.generation = 0
+        self.best_fit = -float('inf')
+        # (generation, best_fit) every time the best solution improves
+        self.progress = []
+        self.updated = Condition()
+
+    def record(self, generation, best_fit):
+        with self.updated:
+            self.generation = generation
+            if best_fit > self.best_fit:
+                self.best_fit = best_fit
+                self.progress.append((generation, best_fit))
+                self.updated.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self.updated:
+            self.status, self.result, self.error = status, result, error
+            self.updated.notify_all()
+
+    def is_done(self):
+        return self.status in ('done', 'failed')
+
+    def get_state(self, since=0):
+        with self.updated:
+            return {'id': self.id, 'status': self.status, 'error': self.error, 'generation': self.generation,
+                    'best_fit': self.best_fit if self.progress else None, 'progress': self.progress[since:]}
+
+    def wait(self, since, timeout):
+        # blocks until there is progress past `since` or the job is over
+        with self.updated:
+            self.updated.wait_for(lambda: len(self.progress) > since or self.is_done(), timeout)
+
+class JobQueue:
+    # runs searches on a small pool of worker threads, keeping the last `max_jobs` jobs around
+    def __init__(self, max_workers=2, max_jobs=256):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='search')
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.lock = Lock()
+
+    def submit(self, search, params):
+        # search(params, on_generation) returns the job's result
+        job = SearchJob(params)
+        with self.lock:
+            self.jobs[job.id] = job
+            finished = [j for j in self.jobs if self.jobs[j].is_done()]
+            for j in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+                del self.jobs[j]
+        self.executor.submit(self.__run, job, search)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    @staticmethod
+    def __run(job, search):
+        job.status = 'running'
+        try:
+            job.finish('done', result=search(job.params, job.record))
+        except Exception as e:
+            job.finish('failed', error=str(e))
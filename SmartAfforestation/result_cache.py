@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from hashlib import sha1
+import json
+import os
+from threading import Lock
+
+class ResultCache:
+    # best solution found so far for each (Zone, area_limit, cost_limit, population), kept in an
+    # in-memory LRU and optionally mirrored to one JSON file per key under `path`
+    def __init__(self, maxsize=1024, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def get_key(zone, area_limit, cost_limit, population):
+        return f"{zone}|{area_limit}|{cost_limit}|{population}"
+
+    def __get_file(self, key):
+        return os.path.join(self.path, sha1(key.encode()).hexdigest() + ".json")
+
+    def __remember(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def __get(self, key):
+        # callers hold the lock
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return dict(self.entries[key])
+        if self.path is None:
+            return None
+        try:
+            with open(self.__get_file(key)) as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        self.__remember(key, entry)
+        return dict(entry)
+
+    def get(self, key):
+        with self.lock:
+            return self.__get(key)
+
+    def put(self, key, counts, fitness, runtime, optimal=False):
+        # keeps the better of the cached and the new solution, searched time adds up; the merge
+        # happens under the lock so concurrent searches of one key never undo each other
+        entry = {'counts': list(counts), 'fitness': fitness, 'runtime': runtime, 'optimal': optimal}
+        with self.lock:
+            old = self.__get(key)
+            if old is not None:
+                entry['runtime'] += old['runtime']
+                if old['fitness'] >= fitness:
+                    entry.update(counts=old['counts'], fitness=old['fitness'], optimal=old['optimal'] or optimal)
+            self.__remember(key, entry)
+            if self.path is not None:
+                # write-then-rename so concurrent readers never see a partial file
+                tmp = self.__get_file(key) + f".{os.getpid()}.tmp"
+                with open(tmp, "w") as fh:
+                    json.dump(entry, fh)
+                os.replace(tmp, self.__get_file(key))
+        return entry
@@ -1,45 +1,75 @@
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from math import isclose
-from pickle import load
+import multiprocessing
+import os
 import random
 from threading import Thread
 import time
 
-class TreePlanterGA:
-    with open("./SmartAfforestation/data/tree_idx.dat", "rb") as __fh:
-        tree_idx = load(__fh)
+import numpy as np
+
+from SmartAfforestation.tree_data import load_tree_table
+
+class _TreeTableAttribute:
+    # class attribute read from the tree table, which is only loaded on first access
+    def __init__(self, get):
+        self.get = get
 
-    with open("./SmartAfforestation/data/tree_info.dat", "rb") as __fh:
-        tree_data = load(__fh)
+    def __get__(self, obj, owner):
+        return self.get(load_tree_table())
 
-    tree_types_count = len(tree_data)
+class TreePlanterGA:
+    tree_idx = _TreeTableAttribute(lambda table: table.index)
+    tree_data = _TreeTableAttribute(lambda table: table.records)
+    tree_types_count = _TreeTableAttribute(len)
+
+    # node budget of the exact engine before it gives up proving optimality
+    exact_max_nodes = 50000
 
-    def __init__(self, AQI, area_limit, cost_limit, population, no_of_chromosomes=20):
+    def __init__(self, AQI, area_limit, cost_limit, population, no_of_chromosomes=20, encoding='binary'):
+        if encoding not in ('binary', 'count'):
+            raise ValueError(f"unknown chromosome encoding '{encoding}'")
+        # 'binary': one 0/1 gene per entry of the sampling set
+        # 'count': one bounded count per tree type, independent of the budget
+        self.encoding = encoding
+        self.AQI = AQI
         self.no_of_chromosomes = no_of_chromosomes
         self.area_limit = area_limit
         self.cost_limit = cost_limit
         self.population = population
         # assign zone and level
         self.Level, self.Zone = __class__.get_aqi_range(AQI)
-        # initialize and get score, area & cost arrays
-        self.score = [0] * __class__.tree_types_count
-        self.area = [0] * __class__.tree_types_count
-        self.cost = [0] * __class__.tree_types_count
+        # get score, area & cost arrays
         self.__get_score()
         # create sampling set
         self.sample_set = []
         self.__get_sampling_set()
+        # cost, area & score of every gene, one row per position in a chromosome
+        self.gene_weights = load_tree_table().weights[self.Zone]
+        if encoding == 'binary':
+            self.gene_weights = self.gene_weights[np.asarray(self.sample_set, dtype=np.intp)]
         # initialize chromosomes
         self.__init_chromosomes()
         # best chromosome and its fitness encoutered so far
         self.best_fit = -float('inf')
         self.best_chromosome = None
+        self.__best = (self.best_fit, self.best_chromosome)
         # some other parameters to keep track of fitness values during search
         self.total_fit = [-float('inf')]*no_of_chromosomes
         self.last_fit = -float('inf')
         self.rep_count = 0
         # searching on different threads
         self.threads = [None]*self.no_of_chromosomes
+        # evaluation mode of the running search, and for 'delta' the cost, area & score totals
+        # and prefix-sum tables of the current chromosomes: id -> (chromosome, totals, prefix)
+        self.evaluation = None
+        self.__delta_cache = {}
+        # upper bound on the total score, equal to the optimum once the exact engine proves it
+        self.upper_bound = None
+        self.is_optimal = False
+        # why the last run_search returned: 'deadline', 'stagnation', 'target' or 'optimal'
+        self.stop_reason = None
 
     @staticmethod
     def get_aqi_range(aqi):
@@ -56,24 +86,29 @@ class TreePlanterGA:
         else:
             return 'Hazardous', 'Zone I'
 
-    def __get_score(self, w1=20, w2=5):
-        tree_data = __class__.tree_data
-        for i in range(__class__.tree_types_count):
-            # f = w1*pi + w2*ui
-            self.area[i] = tree_data[i]['Area']
-            self.cost[i] = tree_data[i]['Cost']
-            # pollution tolerance was per unit area, we covert them to per person per tree
-            self.score[i] = (w1*tree_data[i][self.Zone] + w2*tree_data[i]['Utility'])*self.area[i]
+    def __get_score(self):
+        # precomputed once per zone by the tree table
+        table = load_tree_table()
+        self.area = table.area.tolist()
+        self.cost = table.cost.tolist()
+        self.score = table.scores[self.Zone].tolist()
 
     def __get_sampling_set(self):
         self.minc, self.maxc = float('inf'), -float('inf')
+        # most trees of each type that fit in the budget on their own
+        self.bounds = [0] * __class__.tree_types_count
         for i in range(__class__.tree_types_count):
             count = min(self.cost_limit//self.cost[i], self.area_limit//self.area[i])
             self.minc = min(count, self.minc)
             self.maxc = max(count, self.maxc)
-            self.sample_set.extend([i]*count)
+            self.bounds[i] = count
+            if self.encoding == 'binary':
+                self.sample_set.extend([i]*count)
 
     def __init_chromosomes(self):
+        if self.encoding == 'count':
+            self.__init_count_chromosomes()
+            return
         self.chromosomes = [[0]*len(self.sample_set) for i in range(self.no_of_chromosomes)]
         for c in self.chromosomes:
             choose = random.randint(self.minc, self.maxc)
@@ -81,8 +116,26 @@ class TreePlanterGA:
             for i in idx:
                 c[i] = 1
 
+    def __init_count_chromosomes(self):
+        # same expected number of trees per type as picking `choose` genes of the binary encoding
+        total = sum(self.bounds)
+        self.chromosomes = [[0]*__class__.tree_types_count for i in range(self.no_of_chromosomes)]
+        for c in self.chromosomes:
+            choose = random.randint(self.minc, self.maxc)
+            for i in range(len(c)):
+                expected = self.bounds[i]*choose/total if total else 0
+                c[i] = min(self.bounds[i], round(random.uniform(0, 2)*expected))
+
+    def __mutate_counts(self, chromosome):
+        # a single crossover point over a few genes gives little diversity, so nudge one count
+        i = random.randrange(len(chromosome))
+        old = chromosome[i]
+        chromosome[i] = min(self.bounds[i], max(0, chromosome[i] + random.choice((-1, 1))))
+        if self.evaluation == 'delta' and chromosome[i] != old:
+            self.__delta_cache[id(chromosome)][1] += (chromosome[i] - old)*self.gene_weights[i]
+
     def __crossover(self):
-        M = len(self.sample_set)    # length of a chromosome
+        M = len(self.gene_weights)    # length of a chromosome
         X = self.no_of_chromosomes
         sorted_chrom = [i[0] for i in sorted(zip(self.chromosomes, self.total_fit),
                                              key=lambda i:i[1], reverse=True)][:X//2]
@@ -93,6 +146,34 @@ class TreePlanterGA:
             self.chromosomes[X-i-1] = sorted_chrom[X//2-i-1][:pivot] + sorted_chrom[i][pivot:]
             self.chromosomes[X//2-i-1] = sorted_chrom[i]
             self.chromosomes[X//2+i] = sorted_chrom[X//2-i-1]
+            if self.evaluation == 'delta':
+                self.__cross_totals(self.chromosomes[i], sorted_chrom[i], sorted_chrom[X//2-i-1], pivot)
+                self.__cross_totals(self.chromosomes[X-i-1], sorted_chrom[X//2-i-1], sorted_chrom[i], pivot)
+            if self.encoding == 'count':
+                self.__mutate_counts(self.chromosomes[i])
+                self.__mutate_counts(self.chromosomes[X-i-1])
+
+    def __get_totals(self, chromosome):
+        cached = self.__delta_cache.get(id(chromosome))
+        if cached is None or cached[0] is not chromosome:
+            cached = [chromosome, np.asarray(chromosome, dtype=np.float64) @ self.gene_weights, None]
+            self.__delta_cache[id(chromosome)] = cached
+        return cached[1]
+
+    def __get_prefix(self, chromosome):
+        # prefix[k] = cost, area & score totals of the first k genes
+        self.__get_totals(chromosome)
+        cached = self.__delta_cache[id(chromosome)]
+        if cached[2] is None:
+            cached[2] = np.zeros((len(chromosome)+1, 3))
+            np.cumsum(np.asarray(chromosome, dtype=np.float64)[:, None]*self.gene_weights, axis=0, out=cached[2][1:])
+        return cached[2]
+
+    def __cross_totals(self, child, head, tail, pivot):
+        # child = head[:pivot] + tail[pivot:], so its totals come from the parents' prefix sums in O(1)
+        head_prefix, tail_prefix = self.__get_prefix(head), self.__get_prefix(tail)
+        totals = head_prefix[pivot] + tail_prefix[-1] - tail_prefix[pivot]
+        self.__delta_cache[id(child)] = [child, totals, None]
 
     @staticmethod
     def get_fitness(chromosome, score, sample_set, cost, area, cost_limit, area_limit, population):
@@ -106,28 +187,251 @@ class TreePlanterGA:
         fitness = 100*total_score
         return fitness
 
+    @staticmethod
+    def get_count_fitness(chromosome, score, cost, area, cost_limit, area_limit, population):
+        total_cost = sum(n*cost[i] for i, n in enumerate(chromosome))
+        total_area = sum(n*area[i] for i, n in enumerate(chromosome))
+        if total_cost > cost_limit or total_area > area_limit:
+            return -float('inf')
+        # per capita
+        total_score = sum(n*score[i] for i, n in enumerate(chromosome))/population
+        fitness = 100*total_score
+        return fitness
+
+    @staticmethod
+    def get_batch_fitness(chromosomes, gene_weights, cost_limit, area_limit, population):
+        # whole population as one 0/1 matrix, totals from a single matrix product
+        pool = np.asarray(chromosomes, dtype=np.float64).reshape(-1, len(gene_weights))
+        total_cost, total_area, total_score = (pool @ gene_weights).T
+        fitness = 100*total_score/population
+        fitness[(total_cost > cost_limit) | (total_area > area_limit)] = -float('inf')
+        return fitness.tolist()
+
     def __assign_fitness(self, i):
+        if self.encoding == 'count':
+            self.total_fit[i] = __class__.get_count_fitness(self.chromosomes[i], self.score, self.cost, self.area,
+                                                            self.cost_limit, self.area_limit, self.population)
+            return
         self.total_fit[i] = __class__.get_fitness(self.chromosomes[i], self.score, self.sample_set, self.cost,
                                                   self.area, self.cost_limit, self.area_limit, self.population)
 
-    def run_search(self, runtime=5, max_rep=20, verbose=1):
+    def __evaluate(self, evaluation):
+        if evaluation == 'batch':
+            self.total_fit = __class__.get_batch_fitness(self.chromosomes, self.gene_weights, self.cost_limit,
+                                                         self.area_limit, self.population)
+            return
+        if evaluation == 'delta':
+            # children were scored during crossover and elites keep their totals, only new chromosomes
+            # (fresh populations, migrants) are summed up here
+            totals = np.array([self.__get_totals(c) for c in self.chromosomes]).reshape(-1, 3)
+            self.__delta_cache = {id(c): self.__delta_cache[id(c)] for c in self.chromosomes}
+            total_cost, total_area, total_score = totals.T
+            fitness = 100*total_score/self.population
+            fitness[(total_cost > self.cost_limit) | (total_area > self.area_limit)] = -float('inf')
+            self.total_fit = fitness.tolist()
+            return
+        for i in range(self.no_of_chromosomes):
+            self.threads[i] = Thread(target=self.__assign_fitness, args=(i,))
+            self.threads[i].start()
+        for th in self.threads:
+            th.join()
+
+    def __set_best(self, fitness, chromosome):
+        self.best_fit = fitness
+        self.best_chromosome = chromosome
+        self.__best = (fitness, chromosome)
+
+    def get_best(self):
+        # anytime access to the best fitness and tree counts so far, also while run_search runs on another thread
+        best_fit, best_chromosome = self.__best
+        return best_fit, None if best_chromosome is None else self.get_tree_counts(best_chromosome)
+
+    def __encode(self, counts):
+        # tree counts -> chromosome in this agent's encoding
+        if self.encoding == 'count':
+            return list(counts)
+        chromosome = [0]*len(self.sample_set)
+        start = 0
+        for i, n in enumerate(counts):
+            chromosome[start:start+n] = [1]*n
+            start += self.bounds[i]
+        return chromosome
+
+    def warm_start(self, counts, optimal=False):
+        # continue from a known solution, e.g. one cached by an earlier search
+        fitness = __class__.get_count_fitness(counts, self.score, self.cost, self.area,
+                                              self.cost_limit, self.area_limit, self.population)
+        if fitness > self.best_fit:
+            self.__set_best(fitness, self.__encode(counts))
+            self.chromosomes[0] = list(self.best_chromosome)
+        if optimal:
+            self.is_optimal = True
+            self.upper_bound = sum(n*self.score[i] for i, n in enumerate(counts))
+
+    def __get_fractional_bound(self, items, cost_left, area_left, by_density=None):
+        # relaxing to one constraint at a time and allowing fractional trees gives two upper bounds
+        bounds = []
+        for j, (weight, left) in enumerate(((self.cost, cost_left), (self.area, area_left))):
+            value = 0
+            if by_density is None:
+                ordered = sorted(items, key=lambda i: self.score[i]/weight[i], reverse=True)
+            else:
+                ordered = (i for i in by_density[j] if i in items)
+            for i in ordered:
+                if left <= 0:
+                    break
+                n = min(self.bounds[i], cost_left//self.cost[i], area_left//self.area[i],
+                        left/weight[i])
+                value += n*self.score[i]
+                left -= n*weight[i]
+            bounds.append(value)
+        return min(bounds)
+
+    def __get_root_bound(self):
+        # scores are integral, so nothing can beat the floor of the root relaxation
+        return int(self.__get_fractional_bound(range(__class__.tree_types_count), self.cost_limit, self.area_limit))
+
+    def __run_exact(self, verbose):
+        # branch and bound over the bounded two-constraint knapsack, best score per share of both budgets first
+        items = [i for i in range(__class__.tree_types_count) if self.bounds[i] and self.score[i] > 0]
+        order = sorted(items, key=lambda i: self.score[i]/(self.cost[i]/self.cost_limit + self.area[i]/self.area_limit),
+                       reverse=True)
+        by_density = (sorted(items, key=lambda i: self.score[i]/self.cost[i], reverse=True),
+                      sorted(items, key=lambda i: self.score[i]/self.area[i], reverse=True))
+        remaining = [set(order[k:]) for k in range(len(order))]
+        root_bound = self.__get_root_bound()
+        best = [0, [0]*__class__.tree_types_count]
+        counts = [0]*__class__.tree_types_count
+        nodes = 0
+
+        def branch(k, cost_left, area_left, value):
+            nonlocal nodes
+            nodes += 1
+            if value > best[0]:
+                best[0], best[1] = value, counts[:]
+            if k == len(order) or nodes > __class__.exact_max_nodes or best[0] >= root_bound:
+                return
+            if value + self.__get_fractional_bound(remaining[k], cost_left, area_left, by_density) <= best[0]:
+                return
+            i = order[k]
+            for n in range(min(self.bounds[i], cost_left//self.cost[i], area_left//self.area[i]), -1, -1):
+                counts[i] = n
+                branch(k+1, cost_left - n*self.cost[i], area_left - n*self.area[i], value + n*self.score[i])
+            counts[i] = 0
+
+        branch(0, self.cost_limit, self.area_limit, 0)
+        self.is_optimal = nodes <= __class__.exact_max_nodes
+        self.upper_bound = best[0] if self.is_optimal else root_bound
+        if verbose >= 1: print(f"exact search: {nodes} nodes, optimal={self.is_optimal}")
+        fitness = 100*best[0]/self.population
+        if fitness > self.best_fit:
+            self.__set_best(fitness, self.__encode(best[1]))
+        if self.is_optimal:
+            self.stop_reason = 'optimal'
+
+    def __should_stop(self, stale, patience, target_fitness):
+        # stale: generations (epochs for islands) since the best fitness last improved
+        if self.upper_bound is not None and self.best_fit >= 100*self.upper_bound/self.population:
+            self.stop_reason = 'optimal'
+        elif target_fitness is not None and self.best_fit >= target_fitness:
+            self.stop_reason = 'target'
+        elif patience is not None and stale >= patience:
+            self.stop_reason = 'stagnation'
+        return self.stop_reason is not None
+
+    def __run_islands(self, runtime, max_rep, verbose, evaluation, islands, migration_interval, on_generation,
+                      patience, target_fitness, pool):
+        # independent populations in worker processes, the best of each island migrates
+        # to the next one on a ring after every epoch. Without a shared `pool` the search
+        # starts one of its own for the islands.
+        islands = islands or os.cpu_count()
+        epochs = max(1, int(runtime//migration_interval))
+        args = (self.AQI, self.area_limit, self.cost_limit, self.population, self.no_of_chromosomes, self.encoding)
+        populations = [self.chromosomes] + [None]*(islands-1)
+        own_pool = pool is None
+        if own_pool:
+            pool = ProcessPoolExecutor(max_workers=islands)
+        try:
+            for epoch in range(epochs):
+                futures = [pool.submit(_run_island, args, populations[j], runtime/epochs, max_rep, evaluation,
+                                       patience, target_fitness, random.getrandbits(32)) for j in range(islands)]
+                results = [f.result() for f in futures]
+                improved = False
+                for chromosomes, best_fit, best_chromosome, stop_reason in results:
+                    if best_fit > self.best_fit:
+                        self.__set_best(best_fit, best_chromosome)
+                        improved = True
+                if verbose >= 1: print(f"epoch {epoch}:", *(r[1] for r in results))
+                if on_generation is not None: on_generation(epoch, self.best_fit)
+                # the whole archipelago has stagnated once no island improves on it any more
+                stagnated = all(r[3] == 'stagnation' for r in results) and not improved
+                if self.__should_stop(int(stagnated), 1 if patience is not None else None, target_fitness):
+                    break
+                for j in range(islands):
+                    populations[j] = results[j][0]
+                    migrant = results[j-1][2]
+                    if migrant is not None:
+                        populations[j][-1] = list(migrant)
+        finally:
+            if own_pool:
+                pool.shutdown()
+        self.chromosomes = populations[0]
+
+    def run_search(self, runtime=5, max_rep=20, verbose=1, evaluation='threads', engine='ga',
+                   islands=None, migration_interval=1.0, on_generation=None, patience=None, target_fitness=None,
+                   pool=None):
+        # on_generation(generation, best_fit) is called as the search progresses
+        # (once per epoch for islands, once for the exact engine). `pool` is a get_search_pool()
+        # that island searches share instead of each starting its own.
+        # the search ends after `runtime` seconds, or earlier once the best fitness has not improved
+        # for `patience` generations, reaches `target_fitness` or is proven optimal; see stop_reason
+        if engine not in ('ga', 'exact', 'auto', 'islands'):
+            raise ValueError(f"unknown search engine '{engine}'")
+        self.stop_reason = None
+        if engine in ('exact', 'auto') and self.is_optimal:
+            self.stop_reason = 'optimal'
+            return
+        if engine in ('exact', 'auto'):
+            self.__run_exact(verbose)
+            if on_generation is not None: on_generation(0, self.best_fit)
+            # 'auto' only falls back to a GA when the problem is too large to prove optimal,
+            # searching on islands if they were asked for
+            if engine == 'exact' or self.is_optimal:
+                return
+            self.chromosomes[0] = list(self.best_chromosome)
+            if islands:
+                engine = 'islands'
+        if self.upper_bound is None:
+            self.upper_bound = self.__get_root_bound()
+        if engine == 'islands':
+            self.__run_islands(runtime, max_rep, verbose, evaluation, islands, migration_interval, on_generation,
+                               patience, target_fitness, pool)
+        else:
+            self.__run_ga(runtime, max_rep, verbose, evaluation, on_generation, patience, target_fitness)
+        if self.stop_reason is None:
+            self.stop_reason = 'deadline'
+
+    def __run_ga(self, runtime, max_rep, verbose, evaluation, on_generation, patience, target_fitness):
+        if evaluation not in ('threads', 'batch', 'delta'):
+            raise ValueError(f"unknown evaluation mode '{evaluation}'")
+        self.evaluation = evaluation
         t_end = time.time() + runtime
         t = 0
+        improved_at = 0
         while time.time() <= t_end:
-            for i in range(self.no_of_chromosomes):
-                self.threads[i] = Thread(target=self.__assign_fitness, args=(i,))
-                self.threads[i].start()
-            for th in self.threads:
-                th.join()
+            self.__evaluate(evaluation)
 
-            curr_best_fit, curr_best_ch = min(zip(self.total_fit, self.chromosomes), key=lambda i:i[0])
+            curr_best_fit, curr_best_ch = max(zip(self.total_fit, self.chromosomes), key=lambda i:i[0])
             if curr_best_fit > self.best_fit:
-                self.best_fit = curr_best_fit
-                self.best_chromosome = curr_best_ch
+                self.__set_best(curr_best_fit, curr_best_ch)
+                improved_at = t
 
             if t%100 == 0:
                 if verbose == 2: print(*curr_best_ch, "\t", sep="", end="")
                 if verbose >= 1: print(curr_best_fit)
+            if on_generation is not None: on_generation(t, self.best_fit)
+            if self.__should_stop(t - improved_at, patience, target_fitness):
+                break
 
             if isclose(curr_best_fit, self.last_fit, rel_tol=0.1):
                 self.rep_count += 1
@@ -139,13 +443,45 @@ class TreePlanterGA:
                 continue
             self.__crossover()
 
+    def get_tree_counts(self, chromosome):
+        if self.encoding == 'count':
+            return list(chromosome)
+        counts = [0] * __class__.tree_types_count
+        for i in range(len(self.sample_set)):
+            if chromosome[i]:
+                counts[self.sample_set[i]] += 1
+        return counts
+
     def get_results(self):
         trees = defaultdict(int)
-        for i in range(len(self.sample_set)):
-            if self.best_chromosome[i]:
-                trees[__class__.tree_data[self.sample_set[i]]['Common name']] += 1
+        for i, n in enumerate(self.get_tree_counts(self.best_chromosome)):
+            if n:
+                trees[__class__.tree_data[i]['Common name']] += n
 
         total_score = sum(self.score[__class__.tree_idx[t]]*trees[t] for t in trees)/self.population
         used_area = sum(self.area[__class__.tree_idx[t]]*trees[t] for t in trees)
         used_cost = sum(self.cost[__class__.tree_idx[t]]*trees[t] for t in trees)
-        return {'trees': dict(trees), 'score': total_score, 'area': used_area, 'cost': used_cost}
+        if self.upper_bound is None:
+            self.upper_bound = self.__get_root_bound()
+        bound = self.upper_bound/self.population
+        gap = (bound - total_score)/bound if bound else 0.0
+        return {'trees': dict(trees), 'score': total_score, 'area': used_area, 'cost': used_cost,
+                'bound': bound, 'gap': gap}
+
+
+def get_search_pool(max_workers=None):
+    # worker processes for island searches. They are started by a fork server, or spawned where
+    # there is none, so they never inherit the threads of a server process that owns the pool.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), mp_context=context)
+
+def _run_island(args, chromosomes, runtime, max_rep, evaluation, patience, target_fitness, seed):
+    # one epoch of an island, run in a worker process
+    random.seed(seed)
+    agent = TreePlanterGA(*args)
+    if chromosomes is not None:
+        agent.chromosomes = chromosomes
+    agent.run_search(runtime=runtime, max_rep=max_rep, verbose=0, evaluation=evaluation,
+                     patience=patience, target_fitness=target_fitness)
+    return agent.chromosomes, agent.best_fit, agent.best_chromosome, agent.stop_reason
@@ -1,15 +1,28 @@
-function loaderWidget(){
+function showLoader(){
     var loader = document.getElementById("loader");
     var mainbody = document.getElementById("mainbody");
     mainbody.style.opacity = "0.3";
     mainbody.style.pointerEvents = "none";
     loader.style.display = "block";
+}
+
+function hideLoader(){
+    var loader = document.getElementById("loader");
+    var mainbody = document.getElementById("mainbody");
+    mainbody.style.pointerEvents = "auto";
+    loader.style.display = "none"; 
+    mainbody.style.opacity = "1";
+}
+
+function loaderWidget(){
+    showLoader();
     var time = parseInt(document.getElementsByName("runtime")[0].value);
-    setTimeout(()=>{
-        mainbody.style.pointerEvents = "auto";
-        loader.style.display = "none"; 
-        mainbody.style.opacity = "1";
-    }, time*1100);
+    setTimeout(hideLoader, time*1100);
+}
+
+function showError(message){
+    hideLoader();
+    document.getElementById("progress").textContent = message;
 }
 
 function closeBoard(){
@@ -21,3 +34,44 @@ function openBoard(){
     var board = document.getElementById("board");
     board.style.display = "block";
 }
+
+function submitSearch(form){
+    // run the search as a background job and follow its progress instead of guessing its duration
+    if(!window.fetch || !window.EventSource){
+        loaderWidget();
+        return true;
+    }
+    showLoader();
+    var progress = document.getElementById("progress");
+    fetch("/jobs", {method: "POST", body: new FormData(form)})
+        .then(response => {
+            if(!response.ok){
+                // invalid input or a server error, posting the form again would fail the same way
+                return response.json()
+                    .then(body => showError(body.error || "The search could not be started."),
+                          ()=> showError("The search could not be started."));
+            }
+            return response.json().then(job => {
+                var events = new EventSource(job.events_url);
+                events.onmessage = (e)=>{
+                    var state = JSON.parse(e.data);
+                    if(state.best_fit !== null){
+                        progress.textContent = "Generation " + state.generation + ", best fitness " + state.best_fit.toFixed(2);
+                    }
+                    if(state.status == "done"){
+                        events.close();
+                        window.location = job.result_url;
+                    }
+                    if(state.status == "failed"){
+                        events.close();
+                        showError("The search failed: " + state.error);
+                    }
+                };
+            });
+        }, ()=>{
+            // /jobs could not be reached, fall back to the plain form POST
+            loaderWidget();
+            form.submit();
+        });
+    return false;
+}
@@ -0,0 +1,68 @@
+from functools import lru_cache
+import os
+from pickle import load
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# processed Tree-score.csv rows, see jupyter-notebooks/implement.ipynb
+SOURCE_PATH = os.path.join(DATA_DIR, 'tree_info.dat')
+CACHE_PATH = os.path.join(DATA_DIR, 'tree_table.npz')
+
+ZONES = ('Zone I', 'Zone II', 'Zone III', 'Zone IV')
+# f = w1*pi + w2*ui
+SCORE_WEIGHTS = (20, 5)
+
+TEXT_FIELDS = ('Plant Species', 'Common name', 'Life form')
+NUMBER_FIELDS = ZONES + ('Canopy diameter (in m)', 'Utility', 'Cost', 'Area')
+
+class TreeTable:
+    # struct-of-arrays view of the tree data with the per-zone score vectors precomputed
+    def __init__(self, columns):
+        self.columns = columns
+        self.names = columns['Common name'].tolist()
+        self.area = columns['Area']
+        self.cost = columns['Cost']
+        w1, w2 = SCORE_WEIGHTS
+        # pollution tolerance was per unit area, we covert them to per person per tree
+        self.scores = {zone: (w1*columns[zone] + w2*columns['Utility'])*self.area for zone in ZONES}
+        # cost, area & score of every tree type, one row per type
+        self.weights = {zone: np.stack((self.cost, self.area, self.scores[zone]), axis=1).astype(np.float64)
+                        for zone in ZONES}
+        for array in list(self.scores.values()) + list(self.weights.values()):
+            array.flags.writeable = False
+        # row dictionaries and name -> row, as the pickled tree_info.dat / tree_idx.dat had them
+        self.records = [{field: columns[field][i].item() for field in TEXT_FIELDS + NUMBER_FIELDS}
+                        for i in range(len(self.names))]
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+def read_records(path=SOURCE_PATH):
+    with open(path, "rb") as fh:
+        records = load(fh)
+    columns = {field: np.array([row[field] for row in records]) for field in TEXT_FIELDS}
+    for field in NUMBER_FIELDS:
+        columns[field] = np.array([row[field] for row in records], dtype=np.int64)
+    return columns
+
+@lru_cache(maxsize=None)
+def load_tree_table(path=SOURCE_PATH, cache_path=CACHE_PATH):
+    # loaded on first use; the columns are cached as plain arrays next to the source until it changes
+    mtime = os.stat(path).st_mtime_ns
+    try:
+        with np.load(cache_path) as cached:
+            if cached['mtime'] == mtime:
+                return TreeTable({field: cached[field] for field in TEXT_FIELDS + NUMBER_FIELDS})
+    except (OSError, KeyError, ValueError):
+        pass
+    columns = read_records(path)
+    try:
+        tmp = f"{cache_path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp, mtime=mtime, **columns)
+        os.replace(tmp, cache_path)
+    except OSError:
+        # read-only installs just read the source every time
+        pass
+    return TreeTable(columns)
@@ -0,0 +1,372 @@
+from collections import namedtuple
+from functools import lru_cache
+import io
+import os
+from statistics import NormalDist
+from threading import Lock
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Constants for absorption rates and tree CO2 absorption
+GREEN_ABSORPTION_RATE = 22  # kg CO2 per m² per year for green areas
+WETLANDS_ABSORPTION_RATE = 5.0  # kg CO2 per m² per year for wetlands
+
+TREE_CO2_MIN = 10  # kg CO2 per tree per year (low estimate)
+TREE_CO2_MAX = 40  # kg CO2 per tree per year (high estimate)
+
+PIXEL_TO_METER_CONVERSION = 0.5  # 1 pixel = 0.5 meters (placeholder)
+
+# a land-cover class: inclusive RGB box, kg CO2 absorbed per m² per year, and the names of classes
+# whose pixels are never counted as this one
+LandCoverClass = namedtuple('LandCoverClass', 'name lower upper absorption_rate excludes')
+
+# Define color ranges for green, blue and white areas (in RGB)
+GREEN = LandCoverClass('green', (0, 100, 0), (100, 255, 100), GREEN_ABSORPTION_RATE, ())
+BLUE = LandCoverClass('blue', (0, 0, 100), (100, 100, 255), WETLANDS_ABSORPTION_RATE, ())
+WHITE = LandCoverClass('white', (200, 200, 200), (255, 255, 255), 0, ())
+
+# sink.py leaves white (labels, roads, clouds) out of green and blue, afforestation_offset.py does not
+SINK_CLASSES = (GREEN._replace(excludes=('white',)), BLUE._replace(excludes=('white',)), WHITE)
+OFFSET_CLASSES = (GREEN, BLUE)
+# the class sets by the name the command line tools take
+CLASS_SETS = {'sink': SINK_CLASSES, 'offset': OFFSET_CLASSES}
+
+# rows per strip in tiled mode
+STRIP_ROWS = 1024
+
+# pixels per histogram call of the classifier, and the most classes it counts with a joint histogram
+HISTOGRAM_CHUNK = 1 << 18
+JOINT_CLASSES = 4
+
+EMPTY_RESULT = {
+    "green_pct": 0.0, "blue_pct": 0.0,
+    "green_absorption": 0.0, "wetlands_absorption": 0.0,
+    "total_absorption": 0.0, "trees_needed_min": 0,
+    "trees_needed_max": 0
+}
+
+class ImageDecodeError(ValueError):
+    pass
+
+def _get_raw_tiles(image):
+    # uncompressed RGB/BGR rasters (PPM, BMP, plain TIFF) whose pixel rows can be memory-mapped
+    tiles = []
+    for tile in image.tile:
+        codec, (x0, y0, x1, y1), offset, args = tile[0], tile[1], tile[2], tile[3]
+        rawmode, stride, orientation = (args, 0, 1) if isinstance(args, str) else (tuple(args) + (0, 1))[:3]
+        if codec != 'raw' or rawmode not in ('RGB', 'BGR') or (x0, x1) != (0, image.width):
+            return None
+        tiles.append((y0, y1, offset, rawmode, stride or 3*image.width, orientation))
+    return tiles
+
+# Pillow only reads headers here, so its decompression bomb limit is lifted meanwhile
+_header_lock = Lock()
+
+def _read_header(image, buffer):
+    # (width, height, memory-mappable tiles or None) of a path or, when `buffer` is given, of the
+    # encoded bytes. Raises ImageDecodeError when the file is too short for its mapped rows.
+    with _header_lock:
+        max_pixels, Image.MAX_IMAGE_PIXELS = Image.MAX_IMAGE_PIXELS, None
+        try:
+            with Image.open(image if buffer is None else io.BytesIO(buffer)) as opened:
+                tiles = _get_raw_tiles(opened) if opened.mode == 'RGB' else None
+                width, height = opened.size
+        except OSError:
+            return None, None, None
+        finally:
+            Image.MAX_IMAGE_PIXELS = max_pixels
+    if tiles:
+        size = os.path.getsize(image) if buffer is None else len(buffer)
+        if any(offset + (y1 - y0)*stride > size for y0, y1, offset, _, stride, _ in tiles):
+            raise ImageDecodeError(f"{'image buffer' if buffer is not None else image} is truncated")
+    return width, height, tiles
+
+def _iter_mapped_strips(source, tiles, width, strip_rows):
+    # source: a file path, memory-mapped, or an in-memory buffer, viewed in place
+    for y0, y1, offset, rawmode, stride, orientation in tiles:
+        if isinstance(source, (str, os.PathLike)):
+            rows = np.memmap(source, dtype=np.uint8, mode='r', offset=offset, shape=(y1 - y0, stride))
+        else:
+            rows = np.frombuffer(source, dtype=np.uint8, count=(y1 - y0)*stride, offset=offset)
+            rows = rows.reshape(y1 - y0, stride)
+        rows = rows[:, :3*width].reshape(y1 - y0, width, 3)
+        if orientation < 0:
+            rows = rows[::-1]
+        for start in range(0, y1 - y0, strip_rows):
+            strip = np.asarray(rows[start:start+strip_rows])
+            yield strip if rawmode == 'RGB' else strip[..., ::-1]
+
+def _iter_decoded_strips(img, strip_rows):
+    for start in range(0, img.shape[0], strip_rows):
+        yield cv2.cvtColor(img[start:start+strip_rows], cv2.COLOR_BGR2RGB)
+
+def is_buffer(image):
+    # encoded image bytes (bytes, bytearray, memoryview or a 1-D uint8 array) rather than a path
+    if isinstance(image, np.ndarray):
+        return image.ndim == 1 and image.dtype == np.uint8
+    return isinstance(image, (bytes, bytearray, memoryview))
+
+def _check_array(image):
+    # any other array is an already decoded raster, which has to be H x W x 3 uint8 RGB
+    if image.ndim != 3 or image.shape[2] != 3 or image.dtype != np.uint8:
+        raise TypeError(f"expected encoded image bytes or an H x W x 3 uint8 RGB array, "
+                        f"got a {image.dtype} array of shape {image.shape}")
+    return image
+
+def open_raster(image, strip_rows=None):
+    # (height, width, iterator over RGB strips of `strip_rows` rows); the whole image is one strip
+    # when strip_rows is None. `image` is a path, the encoded image itself, e.g. a PNG screenshot,
+    # or a decoded H x W x 3 RGB array.
+    if isinstance(image, np.ndarray) and not is_buffer(image):
+        rows = _check_array(image)
+        height, width = rows.shape[:2]
+        strip_rows = strip_rows or max(height, 1)
+        return height, width, (rows[i:i+strip_rows] for i in range(0, height, strip_rows))
+    buffer = memoryview(image).cast('B') if is_buffer(image) else None
+    if strip_rows is not None:
+        if buffer is None and str(image).endswith('.npy'):
+            # H x W x 3 RGB array
+            rows = np.load(image, mmap_mode='r')
+            height, width = rows.shape[:2]
+            return height, width, (np.asarray(rows[i:i+strip_rows]) for i in range(0, height, strip_rows))
+        width, height, tiles = _read_header(image, buffer)
+        if tiles:
+            return height, width, _iter_mapped_strips(image if buffer is None else buffer, tiles, width, strip_rows)
+    # compressed formats have to be decoded in one go; in tiled mode only the strips are copied after that
+    img = _decode(image, buffer)
+    return img.shape[0], img.shape[1], _iter_decoded_strips(img, strip_rows or img.shape[0])
+
+def _decode(image, buffer):
+    # BGR array of a path or, when `buffer` is given, of the encoded bytes
+    if buffer is None:
+        img = cv2.imread(str(image))
+    else:
+        img = cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_COLOR) if len(buffer) else None
+    if img is None:
+        raise ImageDecodeError(f"could not decode {'image buffer' if buffer is not None else image}")
+    return img
+
+def load_raster(image):
+    # the whole raster as an H x W x 3 RGB array, a view of the file or buffer where the format allows
+    # so that sampling it only touches the sampled rows; decoded RGB arrays are passed through
+    if isinstance(image, np.ndarray) and not is_buffer(image):
+        return _check_array(image)
+    buffer = memoryview(image).cast('B') if is_buffer(image) else None
+    if buffer is None and str(image).endswith('.npy'):
+        return np.load(image, mmap_mode='r')
+    width, _, tiles = _read_header(image, buffer)
+    if tiles and len(tiles) == 1:
+        strips = _iter_mapped_strips(image if buffer is None else buffer, tiles, width, tiles[0][1] - tiles[0][0])
+        return next(strips)
+    return _decode(image, buffer)[..., ::-1]
+
+class LandCoverClassifier:
+    # Every pixel gets a code with bit k set when it lies in the box of class k. A 256-entry table
+    # per channel turns each channel value into the classes whose range it falls in, so the code is
+    # the AND of three table lookups. Instead of ANDing per pixel, up to JOINT_CLASSES classes are
+    # counted with one 3-D histogram of the looked-up channels and the AND is applied to its bins;
+    # either way a single sweep gives every class count at once, exclusions included.
+    def __init__(self, classes):
+        self.classes = tuple(classes)
+        if not 0 < len(self.classes) <= 8:
+            raise ValueError("between 1 and 8 land-cover classes are supported")
+        names = [c.name for c in self.classes]
+        self.lut = np.zeros((256, 1, 3), dtype=np.uint8)
+        for k, c in enumerate(self.classes):
+            for channel in range(3):
+                self.lut[c.lower[channel]:c.upper[channel]+1, 0, channel] |= 1 << k
+        # membership[code, k]: a pixel with this code counts as class k
+        codes = np.arange(256)
+        self.membership = np.zeros((256, len(self.classes)), dtype=np.int64)
+        for k, c in enumerate(self.classes):
+            excluded = sum(1 << names.index(name) for name in c.excludes)
+            self.membership[:, k] = ((codes >> k) & 1) & ((codes & excluded) == 0)
+        self.bins = 1 << len(self.classes)
+        self.joint = len(self.classes) <= JOINT_CLASSES
+        if self.joint:
+            bits = np.arange(self.bins)
+            joint = bits[:, None, None] & bits[None, :, None] & bits[None, None, :]
+            self.membership = self.membership[joint.ravel()]
+
+    def __chunk_histogram(self, pixels):
+        bits = cv2.LUT(pixels, self.lut)
+        if self.joint:
+            return cv2.calcHist([bits], [0, 1, 2], None, [self.bins]*3, [0, self.bins]*3).ravel()
+        code = cv2.bitwise_and(cv2.bitwise_and(bits[..., 0], bits[..., 1]), bits[..., 2])
+        return cv2.calcHist([code], [0], None, [256], [0, 256]).ravel()
+
+    def histogram(self, strip):
+        # pixels per code of an RGB strip, row b of `membership` says which classes code b counts as
+        pixels = np.ascontiguousarray(strip).reshape(-1, 1, 3)
+        histogram = np.zeros(len(self.membership), dtype=np.int64)
+        # calcHist counts in float32, exact far beyond a chunk, which also keeps the lookups in cache
+        for start in range(0, len(pixels), HISTOGRAM_CHUNK):
+            histogram += self.__chunk_histogram(pixels[start:start+HISTOGRAM_CHUNK]).astype(np.int64)
+        return histogram
+
+    def count(self, strip):
+        # pixels of each class in an RGB strip
+        return self.histogram(strip) @ self.membership
+
+@lru_cache(maxsize=32)
+def get_classifier(classes):
+    return LandCoverClassifier(classes)
+
+def classify_raster(image, classes=SINK_CLASSES, strip_rows=None):
+    # ({class name: pixel count}, height, width) from a single sweep over the raster
+    classifier = get_classifier(tuple(classes))
+    height, width, strips = open_raster(image, strip_rows)
+    counts = np.zeros(len(classifier.classes), dtype=np.int64)
+    for strip in strips:
+        counts += classifier.count(strip)
+    return {c.name: int(n) for c, n in zip(classifier.classes, counts)}, height, width
+
+def summarize(counts, img_height, img_width, classes=SINK_CLASSES):
+    green_pixels, blue_pixels = counts.get('green', 0), counts.get('blue', 0)
+    total_pixels = float(img_height * img_width)
+
+    green_pct = (green_pixels / total_pixels) * 100
+    blue_pct = (blue_pixels / total_pixels) * 100
+
+    # Real-world area conversion based on image dimensions and pixel-to-meter ratio
+    real_world_area_m2 = img_height * img_width * PIXEL_TO_METER_CONVERSION**2
+
+    # Calculate green and blue areas in square meters
+    green_area_m2 = (green_pixels / total_pixels) * real_world_area_m2
+    blue_area_m2 = (blue_pixels / total_pixels) * real_world_area_m2
+
+    # Calculate absorption potential
+    rates = {c.name: c.absorption_rate for c in classes}
+    green_absorption = green_area_m2 * rates.get('green', GREEN_ABSORPTION_RATE)
+    wetlands_absorption = blue_area_m2 * rates.get('blue', WETLANDS_ABSORPTION_RATE)
+
+    # Total absorption is the sum over all classes, green and wetlands for the default ones
+    total_absorption = 0
+    for c in classes:
+        if c.name == 'green':
+            total_absorption += green_absorption
+        elif c.name == 'blue':
+            total_absorption += wetlands_absorption
+        else:
+            total_absorption += (counts[c.name] / total_pixels) * real_world_area_m2 * c.absorption_rate
+
+    # Calculate the number of trees needed to offset emissions
+    trees_needed_min = total_absorption / TREE_CO2_MAX
+    trees_needed_max = total_absorption / TREE_CO2_MIN
+
+    return {
+        "green_pct": green_pct,
+        "blue_pct": blue_pct,
+        "green_absorption": green_absorption,
+        "wetlands_absorption": wetlands_absorption,
+        "total_absorption": total_absorption,
+        "trees_needed_min": trees_needed_min,
+        "trees_needed_max": trees_needed_max
+    }
+
+def analyze_raster(image, classes=SINK_CLASSES, strip_rows=None):
+    # image: a path, encoded image bytes or an RGB array. Raises ImageDecodeError for unreadable images; with
+    # strip_rows the raster is processed strip by strip so memory stays bounded by the strip size
+    # where the format allows
+    counts, height, width = classify_raster(image, classes, strip_rows)
+    return summarize(counts, height, width, classes)
+
+def analyze_image(image, strip_rows=None, classes=SINK_CLASSES, tolerance=None):
+    # image: a file path or the encoded image bytes, e.g. a screenshot straight from the browser
+    # strip_rows: analyze the raster in strips of that many rows to bound memory on very large images
+    # classes: land-cover classes with their colour ranges and absorption rates
+    # tolerance: estimate from a pixel sample instead, with green_pct and blue_pct within +-tolerance
+    # percentage points at 95% confidence; the intervals are under 'ci'
+    # An image that cannot be decoded scores as EMPTY_RESULT.
+    try:
+        if tolerance is not None:
+            return estimate_raster(image, classes, tolerance)
+        return analyze_raster(image, classes, strip_rows)
+    except ImageDecodeError:
+        return dict(EMPTY_RESULT)
+
+def _get_z(confidence):
+    return NormalDist().inv_cdf((1 + confidence)/2)
+
+def _sample_blocks(raster, stride, rng):
+    # one pixel at an independent random offset in every stride x stride block, as
+    # [(block area, sampled RGB pixels)] with the smaller blocks along the bottom and right edges
+    # in groups of their own
+    height, width = raster.shape[:2]
+    rows = [(0, height//stride, stride), (height//stride, 1, height % stride)]
+    columns = [(0, width//stride, stride), (width//stride, 1, width % stride)]
+    groups = []
+    for i0, n_rows, block_height in rows:
+        for j0, n_columns, block_width in columns:
+            if not (n_rows and n_columns and block_height and block_width):
+                continue
+            ys = (i0 + np.arange(n_rows))[:, None]*stride + rng.integers(block_height, size=(n_rows, n_columns))
+            xs = (j0 + np.arange(n_columns))[None, :]*stride + rng.integers(block_width, size=(n_rows, n_columns))
+            groups.append((block_height*block_width, raster[ys, xs]))
+    return groups
+
+def _estimate(histograms, values, population, z):
+    # mean of the per-pixel `values` over the raster from a sample of one pixel per block, given as
+    # [(block area, code histogram)], with its confidence half-width. The variance within a block is
+    # taken to be that of the whole sample, which only overstates it.
+    histogram = sum(h for _, h in histograms)
+    n = histogram.sum()
+    mean = sum(area*h for area, h in histograms) @ values / population
+    if n < 2:
+        return mean, np.zeros_like(mean)
+    variance = histogram @ (values - mean)**2 / (n - 1)
+    design = sum(area*(area - 1)*h.sum() for area, h in histograms) / population**2
+    return mean, z*np.sqrt(variance*design)
+
+def iter_estimates(image, classes=SINK_CLASSES, confidence=0.95, samples=1 << 14, seed=None):
+    # Progressively refined estimates of the analyze_raster result. Each one classifies a stratified
+    # sample, one pixel at its own random offset in every stride x stride block, and the stride
+    # halves from one estimate to the next down to 1, the exact result. Besides the analyze_raster
+    # keys, an estimate has 'ci' {key: (low, high)}, 'sampled_pixels' and 'stride'.
+    classifier = get_classifier(tuple(classes))
+    raster = load_raster(image)
+    height, width = raster.shape[:2]
+    population = height*width
+    z = _get_z(confidence)
+    rng = np.random.default_rng(seed)
+
+    # every reported figure is the population total or mean of a per-pixel value
+    names = [c.name for c in classifier.classes]
+    member = classifier.membership.astype(np.float64)
+    pixel_area = PIXEL_TO_METER_CONVERSION**2
+    rates = {c.name: c.absorption_rate for c in classifier.classes}
+    zero = np.zeros(len(member))
+    green = member[:, names.index('green')] if 'green' in names else zero
+    blue = member[:, names.index('blue')] if 'blue' in names else zero
+    total = member @ np.array([c.absorption_rate for c in classifier.classes], dtype=np.float64)*pixel_area
+    values = np.stack([100*green, 100*blue,
+                       green*rates.get('green', GREEN_ABSORPTION_RATE)*pixel_area,
+                       blue*rates.get('blue', WETLANDS_ABSORPTION_RATE)*pixel_area,
+                       total, total/TREE_CO2_MAX, total/TREE_CO2_MIN], axis=1)
+    keys = list(EMPTY_RESULT)
+    scale = np.array([1, 1] + [population]*5, dtype=np.float64)
+
+    stride = max(1, int(np.sqrt(population/samples)))
+    while True:
+        histograms = [(area, classifier.histogram(pixels)) for area, pixels in _sample_blocks(raster, stride, rng)]
+        mean, half_width = _estimate(histograms, values, population, z)
+        # every sampled pixel stands for the pixels of its block
+        counts = sum(area*h for area, h in histograms) @ classifier.membership
+        result = summarize({c.name: n for c, n in zip(classifier.classes, counts)}, height, width, classes)
+        result['ci'] = {key: (float(max(0.0, (m - h)*k)), float((m + h)*k))
+                        for key, m, h, k in zip(keys, mean, half_width, scale)}
+        result.update(sampled_pixels=int(sum(h.sum() for _, h in histograms)), stride=stride)
+        yield result
+        if stride == 1:
+            return
+        stride //= 2
+
+def estimate_raster(image, classes=SINK_CLASSES, tolerance=1.0, confidence=0.95, samples=1 << 14, seed=None):
+    # the first estimate whose green_pct and blue_pct confidence intervals are within +-tolerance
+    # percentage points; tolerance=0 refines all the way to the exact counts
+    for result in iter_estimates(image, classes, confidence, samples, seed):
+        if all((high - low)/2 <= tolerance for low, high in (result['ci']['green_pct'], result['ci']['blue_pct'])):
+            return result
+    return result
@@ -0,0 +1,173 @@
+import argparse
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import csv
+import glob
+import os
+import sys
+
+from landcover.analysis import CLASS_SETS, EMPTY_RESULT, SINK_CLASSES, STRIP_ROWS, classify_raster, summarize
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.ppm', '.webp', '.npy')
+
+# summed over every image that decoded
+TOTAL_FIELDS = ('green_absorption', 'wetlands_absorption', 'total_absorption', 'trees_needed_min',
+                'trees_needed_max')
+
+def iter_image_paths(sources):
+    # sources: a directory, a glob pattern, an image path or a list of any of those
+    if isinstance(sources, (str, os.PathLike)):
+        sources = [sources]
+    for source in sources:
+        source = os.fspath(source)
+        if os.path.isdir(source):
+            for name in sorted(os.listdir(source)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(source, name)
+        elif glob.has_magic(source):
+            yield from sorted(glob.glob(source, recursive=True))
+        else:
+            yield source
+
+def analyze_path(image_path, classes=SINK_CLASSES, strip_rows=STRIP_ROWS):
+    # one output row; unreadable images are reported rather than scored as all zeros, and whatever
+    # an image fails with only fails its own row, never the batch
+    row = {'path': image_path, 'status': 'ok', 'error': '', 'height': 0, 'width': 0}
+    row.update((f"{c.name}_pixels", 0) for c in classes)
+    row.update(EMPTY_RESULT)
+    try:
+        counts, height, width = classify_raster(image_path, classes, strip_rows)
+    except Exception as e:
+        row.update(status='error', error=f"{type(e).__name__}: {e}" if str(e) else type(e).__name__)
+        return row
+    row.update(height=height, width=width)
+    row.update((f"{name}_pixels", n) for name, n in counts.items())
+    row.update(summarize(counts, height, width, classes))
+    return row
+
+def analyze_batch(sources, classes=SINK_CLASSES, strip_rows=STRIP_ROWS, workers=None, max_in_flight=None):
+    # yields a row per image as it finishes, in completion order. Images are analyzed strip by strip in
+    # a process pool and at most `max_in_flight` are submitted at once, so memory stays bounded
+    # however many images there are.
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or 2*workers
+    paths = iter_image_paths(sources)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for path in paths:
+            pending.add(executor.submit(analyze_path, path, classes, strip_rows))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+def add_to_totals(totals, row):
+    totals['images'] += 1
+    if row['status'] != 'ok':
+        totals['failed'] += 1
+        return
+    for field in TOTAL_FIELDS:
+        totals[field] += row[field]
+
+class CsvWriter:
+    def __init__(self, path, fields):
+        self.fh = open(path, 'w', newline='')
+        self.writer = csv.DictWriter(self.fh, fieldnames=fields)
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+        # flushed per row so the file can be followed while the batch runs
+        self.fh.flush()
+
+    def close(self):
+        self.fh.close()
+
+class ParquetWriter:
+    # rows are written in row groups of `batch_size`
+    def __init__(self, path, fields, batch_size=256):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("writing Parquet needs pyarrow, use a .csv output instead")
+        self.pyarrow = pyarrow
+        self.path = path
+        self.fields = fields
+        self.batch_size = batch_size
+        self.rows = []
+        self.writer = None
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.__flush()
+
+    def __flush(self):
+        if not self.rows:
+            return
+        table = self.pyarrow.Table.from_pylist(self.rows).select(self.fields)
+        if self.writer is None:
+            self.writer = self.pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+        self.rows = []
+
+    def close(self):
+        self.__flush()
+        if self.writer is not None:
+            self.writer.close()
+
+def open_writer(path, fields):
+    if str(path).endswith('.parquet'):
+        return ParquetWriter(path, fields)
+    return CsvWriter(path, fields)
+
+def run_batch(sources, output, classes=SINK_CLASSES, strip_rows=STRIP_ROWS, workers=None, max_in_flight=None,
+              verbose=1):
+    # streams every image's row to `output` and returns the aggregate totals
+    fields = ['path', 'status', 'error', 'height', 'width'] + [f"{c.name}_pixels" for c in classes] \
+        + list(EMPTY_RESULT)
+    writer = open_writer(output, fields)
+    totals = {'images': 0, 'failed': 0}
+    totals.update((field, 0.0) for field in TOTAL_FIELDS)
+    try:
+        for row in analyze_batch(sources, classes, strip_rows, workers, max_in_flight):
+            writer.write(row)
+            add_to_totals(totals, row)
+            if row['status'] != 'ok':
+                print(f"{row['path']}: {row['error']}", file=sys.stderr)
+            if verbose:
+                print(f"{totals['images']} images, {totals['failed']} failed, "
+                      f"total absorption {totals['total_absorption']:.2f} kg", end='\r')
+    finally:
+        writer.close()
+    if verbose:
+        print()
+    return totals
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score a batch of map captures for green and blue cover.")
+    parser.add_argument('sources', nargs='+', help="image files, directories or glob patterns")
+    parser.add_argument('--output', default='landcover_results.csv', help="a .csv or .parquet file")
+    parser.add_argument('--classes', default='sink', choices=list(CLASS_SETS),
+                        help="sink.py (white excluded) or afforestation_offset.py colour classes")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-in-flight', type=int, default=None,
+                        help="images submitted to the pool at once, twice the workers by default")
+    parser.add_argument('--strip-rows', type=int, default=STRIP_ROWS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = get_args(argv)
+    totals = run_batch(args.sources, args.output, CLASS_SETS[args.classes], args.strip_rows, args.workers,
+                       args.max_in_flight)
+    print(f"Images: {totals['images']} ({totals['failed']} failed)")
+    print(f"Total CO₂ Absorption: {totals['total_absorption']:.2f} kg")
+    print(f"Trees Needed: {totals['trees_needed_min']:.2f} - {totals['trees_needed_max']:.2f}")
+    print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import argparse
+import asyncio
+import atexit
+import os
+from pathlib import Path
+import tempfile
+from threading import Lock, Thread
+
+from playwright.async_api import async_playwright
+
+# the map site and the element whose presence means the map has rendered; both can point at a local page
+URL_TEMPLATE = os.environ.get('CAPTURE_URL_TEMPLATE',
+                              "https://www.google.com/maps/@{latitude},{longitude},{zoom}z/data=!5m1!1e4")
+READY_SELECTOR = os.environ.get('CAPTURE_READY_SELECTOR', '//*[@id="searchboxinput"]')
+
+class CapturePool:
+    # A warm headless Chromium with `contexts` browser contexts of `pages_per_context` pages each.
+    # Every capture borrows an idle page, so up to contexts*pages_per_context captures run at once.
+    # Pages are replaced after `max_page_uses` captures or after any failure.
+    def __init__(self, url_template=URL_TEMPLATE, ready_selector=READY_SELECTOR, contexts=1, pages_per_context=4,
+                 timeout=20000, max_page_uses=50, viewport=None, headless=True):
+        self.url_template = url_template
+        self.ready_selector = ready_selector
+        self.contexts = contexts
+        self.pages_per_context = pages_per_context
+        self.timeout = timeout
+        self.max_page_uses = max_page_uses
+        self.viewport = viewport
+        self.headless = headless
+        self.playwright = None
+        self.browser = None
+        self.idle = None
+        self.uses = {}
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=self.headless)
+        self.lock = asyncio.Lock()
+        self.idle = asyncio.Queue()
+        for _ in range(self.contexts):
+            context = await self.__new_context()
+            for _ in range(self.pages_per_context):
+                await self.idle.put(await self.__new_page(context))
+        return self
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.browser = self.playwright = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def __new_context(self):
+        return await self.browser.new_context(viewport=self.viewport) if self.viewport \
+            else await self.browser.new_context()
+
+    async def __new_page(self, context):
+        page = await context.new_page()
+        page.set_default_timeout(self.timeout)
+        self.uses[page] = 0
+        return page
+
+    async def __get_context(self):
+        # the context with the fewest pages; a browser that went away (e.g. Chromium crashed) is
+        # relaunched first and closed contexts are replaced, so the pool heals itself
+        async with self.lock:
+            if not self.browser.is_connected():
+                try:
+                    await self.browser.close()
+                except Exception:
+                    pass
+                self.browser = await self.playwright.chromium.launch(headless=self.headless)
+            while len(self.browser.contexts) < self.contexts:
+                await self.__new_context()
+            return min(self.browser.contexts, key=lambda context: len(context.pages))
+
+    async def __recycle(self, page):
+        # a fresh page instead of `page`. When even that fails the old, closed page is returned and
+        # the next capture that borrows it tries again.
+        self.uses.pop(page, None)
+        try:
+            await page.close()
+        except Exception:
+            pass
+        try:
+            return await self.__new_page(await self.__get_context())
+        except Exception:
+            return page
+
+    def get_url(self, latitude, longitude, zoom=10):
+        return self.url_template.format(latitude=latitude, longitude=longitude, zoom=zoom)
+
+    async def capture(self, latitude, longitude, zoom=10, timeout=None):
+        # PNG bytes of the full page once the ready selector is there
+        timeout = timeout or self.timeout
+        page = await self.idle.get()
+        try:
+            if page.is_closed():
+                # left behind while the browser was down
+                page = await self.__recycle(page)
+            await page.goto(self.get_url(latitude, longitude, zoom), timeout=timeout)
+            await page.wait_for_selector(self.ready_selector, timeout=timeout)
+            screenshot = await page.screenshot(full_page=True, timeout=timeout)
+            self.uses[page] += 1
+        except Exception:
+            # a page that timed out may still be loading, start over with a fresh one
+            page = await self.__recycle(page)
+            raise
+        finally:
+            if self.uses.get(page, 0) >= self.max_page_uses:
+                page = await self.__recycle(page)
+            self.idle.put_nowait(page)
+        return screenshot
+
+    async def capture_many(self, locations, zoom=10, return_exceptions=True):
+        # locations: (latitude, longitude) or (latitude, longitude, zoom) tuples, captured concurrently
+        return await asyncio.gather(*(self.capture(*location) if len(location) == 3
+                                      else self.capture(*location, zoom=zoom) for location in locations),
+                                    return_exceptions=return_exceptions)
+
+class BackgroundCapturePool:
+    # CapturePool on its own event loop thread, for synchronous callers such as the scripts' main()
+    def __init__(self, **options):
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, name='capture', daemon=True)
+        self.thread.start()
+        self.pool = self.__run(CapturePool(**options).start())
+
+    def __run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def capture(self, latitude, longitude, zoom=10, timeout=None):
+        return self.__run(self.pool.capture(latitude, longitude, zoom, timeout))
+
+    def capture_many(self, locations, zoom=10):
+        return self.__run(self.pool.capture_many(locations, zoom))
+
+    def close(self):
+        if self.loop.is_running():
+            self.__run(self.pool.close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+_shared_pool = None
+_shared_lock = Lock()
+
+def get_capture_pool():
+    # one warm browser per process, shared by every capture and closed at exit
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = BackgroundCapturePool()
+            atexit.register(_shared_pool.close)
+        return _shared_pool
+
+def capture_map(latitude, longitude, zoom=10, timeout=None):
+    return get_capture_pool().capture(latitude, longitude, zoom, timeout)
+
+# a static stand-in for the map site: a green and a blue block that analyze_raster can score
+CHECK_PAGE = """<!DOCTYPE html>
+<html><body style="margin:0; background:#fff">
+<div id="map" style="display:flex; width:400px; height:300px">
+<div style="flex:3; background:rgb(30,160,40)"></div><div style="flex:1; background:rgb(20,40,200)"></div>
+</div></body></html>
+"""
+
+def check(captures=8, **options):
+    # Captures a local copy of CHECK_PAGE through a pool, closes the browser halfway as if it had
+    # crashed and captures again, so the capture path and its recovery run without the network.
+    # Returns the analyze_raster result of every capture, or the exception it failed with.
+    from landcover.analysis import analyze_raster
+    with tempfile.TemporaryDirectory() as tmp:
+        page = Path(tmp, 'map.html')
+        page.write_text(CHECK_PAGE)
+        options.setdefault('pages_per_context', 2)
+        pool = BackgroundCapturePool(url_template=page.as_uri() + "?lat={latitude}&lon={longitude}&zoom={zoom}",
+                                     ready_selector='#map', **options)
+        try:
+            locations = [(i, i) for i in range(captures)]
+            screenshots = pool.capture_many(locations[:captures//2])
+            asyncio.run_coroutine_threadsafe(pool.pool.browser.close(), pool.loop).result()
+            screenshots += pool.capture_many(locations[captures//2:])
+        finally:
+            pool.close()
+    return [s if isinstance(s, Exception) else analyze_raster(s) for s in screenshots]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the capture pool against a local static page.")
+    parser.add_argument('--captures', type=int, default=8)
+    args = parser.parse_args(argv)
+    results = check(args.captures)
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            print(f"capture {i}: failed, {str(result).splitlines()[0]}")
+        else:
+            print(f"capture {i}: green {result['green_pct']:.2f}%, blue {result['blue_pct']:.2f}%")
+    if any(isinstance(result, Exception) for result in results):
+        raise SystemExit("capture check failed")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+from hashlib import sha1
+import json
+import os
+from threading import Lock
+import time
+
+from landcover.analysis import ImageDecodeError, SINK_CLASSES, analyze_raster, is_buffer
+
+CACHE_PATH = os.environ.get('CAPTURE_CACHE_PATH',
+                            os.path.join(os.path.expanduser('~'), '.cache', 'quarrycrew', 'captures'))
+CACHE_TTL = float(os.environ.get('CAPTURE_CACHE_TTL', 7*24*3600))
+CACHE_MAX_BYTES = int(os.environ.get('CAPTURE_CACHE_MAX_BYTES', 1 << 30))
+
+class CaptureCache:
+    # Map screenshots and their analysis results on disk, one <key>.png and one <key>.json per
+    # (latitude, longitude, zoom, viewport). Entries older than `ttl` seconds are misses, and the
+    # least recently used ones are evicted once the files add up to more than `max_bytes`.
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def get_key(latitude, longitude, zoom=10, viewport=None):
+        # coordinates are rounded to ~1 cm so that float noise maps to the same capture
+        size = f"{viewport['width']}x{viewport['height']}" if viewport else 'default'
+        return sha1(f"{latitude:.7f}|{longitude:.7f}|{zoom}|{size}".encode()).hexdigest()
+
+    @staticmethod
+    def get_classes_key(classes):
+        return sha1(repr(tuple(classes)).encode()).hexdigest()
+
+    def __get_file(self, key, ext):
+        return os.path.join(self.path, key + ext)
+
+    def __is_fresh(self, file):
+        # the mtime is when the entry was captured, the atime stands in for the last use
+        try:
+            return time.time() - os.stat(file).st_mtime <= self.ttl
+        except OSError:
+            return False
+
+    def __touch(self, key):
+        # a hit on either file is a use of the whole entry
+        now = time.time()
+        for ext in (".png", ".json"):
+            file = self.__get_file(key, ext)
+            try:
+                os.utime(file, (now, os.stat(file).st_mtime))
+            except OSError:
+                pass
+
+    def __write(self, file, data):
+        # write-then-rename so concurrent readers never see a partial file
+        tmp = f"{file}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp, file)
+
+    def get_screenshot_path(self, key):
+        file = self.__get_file(key, ".png")
+        if not self.__is_fresh(file):
+            return None
+        self.__touch(key)
+        return file
+
+    def get_screenshot(self, key):
+        file = self.get_screenshot_path(key)
+        if file is None:
+            return None
+        try:
+            with open(file, "rb") as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def put_screenshot(self, key, screenshot):
+        with self.lock:
+            self.__write(self.__get_file(key, ".png"), screenshot)
+            # a new capture makes the old analysis stale
+            try:
+                os.remove(self.__get_file(key, ".json"))
+            except OSError:
+                pass
+            self.__evict()
+        return self.__get_file(key, ".png")
+
+    def get_analysis(self, key, classes=SINK_CLASSES):
+        file = self.__get_file(key, ".json")
+        if not self.__is_fresh(self.__get_file(key, ".png")):
+            return None
+        try:
+            with open(file) as fh:
+                result = json.load(fh).get(self.get_classes_key(classes))
+        except (OSError, ValueError):
+            return None
+        if result is not None:
+            self.__touch(key)
+        return result
+
+    def put_analysis(self, key, result, classes=SINK_CLASSES):
+        # one screenshot can be analyzed with several class sets, each is kept
+        file = self.__get_file(key, ".json")
+        with self.lock:
+            try:
+                with open(file) as fh:
+                    results = json.load(fh)
+            except (OSError, ValueError):
+                results = {}
+            results[self.get_classes_key(classes)] = result
+            self.__write(file, json.dumps(results).encode())
+            self.__evict()
+
+    def remove(self, key):
+        with self.lock:
+            for ext in (".png", ".json"):
+                try:
+                    os.remove(self.__get_file(key, ext))
+                except OSError:
+                    pass
+
+    def __evict(self):
+        # whole entries go, the screenshot and its analysis together, least recently used first
+        entries = {}
+        for entry in os.scandir(self.path):
+            key, ext = os.path.splitext(entry.name)
+            if ext in ('.png', '.json'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                used, size = entries.get(key, (0, 0))
+                entries[key] = (max(used, stat.st_atime), size + stat.st_size)
+        total = sum(size for _, size in entries.values())
+        for key, (_, size) in sorted(entries.items(), key=lambda entry: entry[1][0]):
+            if total <= self.max_bytes:
+                break
+            for ext in (".png", ".json"):
+                try:
+                    os.remove(self.__get_file(key, ext))
+                except OSError:
+                    pass
+            total -= size
+
+_shared_cache = None
+
+def get_capture_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = CaptureCache()
+    return _shared_cache
+
+def analyze_location(latitude, longitude, zoom=10, classes=SINK_CLASSES, cache=None, capture=None, viewport=None):
+    # analysis of the map around (latitude, longitude); a cached analysis skips decoding and a
+    # cached screenshot skips the browser. capture(latitude, longitude, zoom) returns PNG bytes and
+    # `viewport` is the one it captures with, None for the shared pool's default. Raises
+    # ImageDecodeError for a capture that cannot be decoded, which is not cached.
+    cache = cache or get_capture_cache()
+    if capture is None:
+        from landcover.capture import capture_map as capture
+    key = cache.get_key(latitude, longitude, zoom, viewport)
+    result = cache.get_analysis(key, classes)
+    if result is not None:
+        return result
+    image = cache.get_screenshot_path(key)
+    if image is None:
+        # a fresh capture is analyzed straight from memory and stored afterwards
+        image = capture(latitude, longitude, zoom)
+    try:
+        result = analyze_raster(image, classes)
+    except ImageDecodeError:
+        # a broken capture is not worth keeping
+        cache.remove(key)
+        raise
+    if is_buffer(image):
+        cache.put_screenshot(key, image)
+    cache.put_analysis(key, result, classes)
+    return result
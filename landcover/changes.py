@@ -0,0 +1,124 @@
+import argparse
+from hashlib import sha1
+import os
+import time
+import zlib
+
+import numpy as np
+
+from landcover.analysis import (CLASS_SETS, PIXEL_TO_METER_CONVERSION, SINK_CLASSES, get_classifier, load_raster,
+                                summarize)
+
+TILE_SIZE = 256
+
+def _get_band(raster, y, tile_size):
+    # the band's pixels as stored, so hashing it needs no colour conversion
+    band = raster[y:y+tile_size]
+    if band.strides[-1] < 0:
+        band = band[..., ::-1]
+    return np.ascontiguousarray(band)
+
+def _get_tile_hashes(band, tile_size):
+    # one CRC per tile of the band, chained over the tile's rows
+    rows = band.reshape(band.shape[0], -1)
+    width = tile_size*band.shape[2]
+    hashes = [0]*((band.shape[1] + tile_size - 1)//tile_size)
+    for row in rows:
+        for j in range(len(hashes)):
+            hashes[j] = zlib.crc32(row[j*width:(j+1)*width], hashes[j])
+    return hashes
+
+def load_state(path):
+    # per-tile hashes and class counts of the last survey, and the survey history
+    try:
+        with np.load(path) as state:
+            return {key: state[key] for key in state.files}
+    except (OSError, ValueError):
+        return None
+
+def save_state(path, state):
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, **state)
+    os.replace(tmp, path)
+
+def survey(image, state_path, classes=SINK_CLASSES, tile_size=TILE_SIZE):
+    # Analyzes a new capture of a site surveyed before, reclassifying only the tiles that changed.
+    # Every band of tile_size rows is hashed first and only the changed bands are hashed tile by
+    # tile; the class counts of unchanged tiles come from the state saved at `state_path`, which is
+    # then updated. A capture of another size, or with other classes or tiles, is analyzed in full.
+    # Besides the analyze_raster keys the result has 'changes' {class: {'gained_m2', 'lost_m2'}}
+    # since the last survey, summed tile by tile so changes within one tile net out, the number of
+    # 'tiles' and 'changed_tiles', and the 'history' of (time, total_absorption) of every survey.
+    classifier = get_classifier(tuple(classes))
+    raster = load_raster(image)
+    height, width = raster.shape[:2]
+    bands, columns = (height + tile_size - 1)//tile_size, (width + tile_size - 1)//tile_size
+    classes_key = sha1(repr(classifier.classes).encode()).hexdigest()
+
+    state = load_state(state_path)
+    if state is None or tuple(state['shape']) != (height, width, tile_size) or str(state['classes']) != classes_key:
+        previous = None
+        band_hashes = np.zeros(bands, dtype=np.int64)
+        tile_hashes = np.zeros((bands, columns), dtype=np.int64)
+        tile_counts = np.zeros((bands, columns, len(classifier.classes)), dtype=np.int64)
+    else:
+        previous = state
+        band_hashes, tile_hashes = state['band_hashes'].copy(), state['tile_hashes'].copy()
+        tile_counts = state['tile_counts'].copy()
+
+    changed = 0
+    for i in range(bands):
+        y = i*tile_size
+        band = _get_band(raster, y, tile_size)
+        band_hash = zlib.crc32(band)
+        if previous is not None and band_hash == band_hashes[i]:
+            continue
+        band_hashes[i] = band_hash
+        for j, tile_hash in enumerate(_get_tile_hashes(band, tile_size)):
+            if previous is not None and tile_hash == tile_hashes[i, j]:
+                continue
+            tile_hashes[i, j] = tile_hash
+            tile_counts[i, j] = classifier.count(raster[y:y+tile_size, j*tile_size:(j+1)*tile_size])
+            changed += 1
+
+    counts = tile_counts.sum(axis=(0, 1))
+    result = summarize({c.name: int(n) for c, n in zip(classifier.classes, counts)}, height, width, classes)
+
+    pixel_area = PIXEL_TO_METER_CONVERSION**2
+    delta = tile_counts - previous['tile_counts'] if previous is not None else np.zeros_like(tile_counts)
+    result['changes'] = {c.name: {'gained_m2': float(np.clip(delta[..., k], 0, None).sum()*pixel_area),
+                                  'lost_m2': float(np.clip(-delta[..., k], 0, None).sum()*pixel_area)}
+                         for k, c in enumerate(classifier.classes)}
+    result.update(tiles=bands*columns, changed_tiles=changed)
+
+    history = np.array([[time.time(), result['total_absorption']]])
+    if previous is not None:
+        history = np.concatenate([previous['history'], history])
+    result['history'] = [tuple(entry) for entry in history.tolist()]
+    save_state(state_path, {'shape': np.array([height, width, tile_size]), 'classes': np.array(classes_key),
+                            'band_hashes': band_hashes, 'tile_hashes': tile_hashes, 'tile_counts': tile_counts,
+                            'history': history})
+    return result
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Re-survey a site, reanalyzing only what changed since last time.")
+    parser.add_argument('image')
+    parser.add_argument('state', help="survey state of the site, a .npz file created on the first survey")
+    parser.add_argument('--classes', default='sink', choices=list(CLASS_SETS))
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = get_args(argv)
+    result = survey(args.image, args.state, CLASS_SETS[args.classes], args.tile_size)
+    print(f"Tiles reanalyzed: {result['changed_tiles']} / {result['tiles']}")
+    print(f"Total CO₂ Absorption: {result['total_absorption']:.2f} kg")
+    for name in ('green', 'blue'):
+        if name in result['changes']:
+            change = result['changes'][name]
+            print(f"{name.capitalize()} area: +{change['gained_m2']:.2f} m² / -{change['lost_m2']:.2f} m²")
+    if len(result['history']) > 1:
+        print(f"Change since last survey: {result['history'][-1][1] - result['history'][-2][1]:+.2f} kg")
+
+if __name__ == "__main__":
+    main()
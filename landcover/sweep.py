@@ -0,0 +1,108 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import csv
+import sys
+import time
+
+import numpy as np
+
+from landcover.analysis import CLASS_SETS, EMPTY_RESULT, SINK_CLASSES
+from landcover.batch import TOTAL_FIELDS, add_to_totals
+from landcover.capture_cache import analyze_location, get_capture_cache
+
+def get_grid(south, west, north, east, step):
+    # centres of the step x step cells covering the bounding box, south to north and west to east
+    latitudes = np.arange(south + step/2, north, step)
+    longitudes = np.arange(west + step/2, east, step)
+    return latitudes, longitudes
+
+def analyze_cell(cell, zoom, classes, cache, capture, viewport=None):
+    i, j, latitude, longitude = cell
+    row = {'row': i, 'col': j, 'latitude': latitude, 'longitude': longitude, 'status': 'ok', 'error': ''}
+    try:
+        row.update(analyze_location(latitude, longitude, zoom, classes, cache, capture, viewport))
+    except Exception as e:
+        # one cell that would not load does not stop the sweep
+        row.update(EMPTY_RESULT)
+        row.update(status='error', error=str(e).splitlines()[0] if str(e) else type(e).__name__)
+    return row
+
+def sweep(south, west, north, east, step, zoom=10, classes=SINK_CLASSES, parallelism=4, cache=None, capture=None,
+          on_cell=None, viewport=None):
+    # Captures and analyzes every grid cell with up to `parallelism` cells in flight, sharing one
+    # browser whose page pool is sized to match. Returns the gridded total absorption (NaN where a
+    # cell failed), one row per cell in completion order, and the regional totals. `viewport` is
+    # the browser's, or the one `capture` captures with; captures are cached per viewport.
+    latitudes, longitudes = get_grid(south, west, north, east, step)
+    cells = [(i, j, float(lat), float(lon)) for i, lat in enumerate(latitudes) for j, lon in enumerate(longitudes)]
+    cache = cache or get_capture_cache()
+    pool = None
+    if capture is None:
+        from landcover.capture import BackgroundCapturePool
+        pool = BackgroundCapturePool(pages_per_context=parallelism, viewport=viewport)
+        capture = pool.capture
+
+    grid = np.full((len(latitudes), len(longitudes)), np.nan)
+    rows = []
+    totals = {'images': 0, 'failed': 0}
+    totals.update((field, 0.0) for field in TOTAL_FIELDS)
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='sweep') as executor:
+            futures = [executor.submit(analyze_cell, cell, zoom, classes, cache, capture, viewport)
+                       for cell in cells]
+            for future in as_completed(futures):
+                row = future.result()
+                if row['status'] == 'ok':
+                    grid[row['row'], row['col']] = row['total_absorption']
+                add_to_totals(totals, row)
+                rows.append(row)
+                if on_cell is not None:
+                    on_cell(row, totals)
+    finally:
+        if pool is not None:
+            pool.close()
+    elapsed = time.perf_counter() - start
+    totals.update(cells=totals.pop('images'), elapsed_s=elapsed,
+                  cells_per_minute=60*len(rows)/elapsed if elapsed else None)
+    return grid, rows, totals
+
+def write_rows(path, rows):
+    fields = ['row', 'col', 'latitude', 'longitude', 'status', 'error'] + list(EMPTY_RESULT)
+    with open(path, 'w', newline='') as fh:
+        writer = csv.DictWriter(fh, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(sorted(rows, key=lambda row: (row['row'], row['col'])))
+
+def get_args(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate the CO₂ sink of a region from a grid of map captures.")
+    parser.add_argument('--bbox', nargs=4, type=float, required=True, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'))
+    parser.add_argument('--step', type=float, required=True, help="grid step in degrees")
+    parser.add_argument('--zoom', type=int, default=10)
+    parser.add_argument('--classes', default='sink', choices=list(CLASS_SETS))
+    parser.add_argument('--parallelism', type=int, default=4, help="cells captured and analyzed at once")
+    parser.add_argument('--output', default='sweep_results.csv', help="one row per grid cell")
+    parser.add_argument('--grid', default=None, help="also save the absorption grid as a .npy array")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = get_args(argv)
+
+    def on_cell(row, totals):
+        if row['status'] != 'ok':
+            print(f"({row['latitude']:.5f}, {row['longitude']:.5f}): {row['error']}", file=sys.stderr)
+        print(f"{totals['images']} cells, {totals['failed']} failed", end='\r')
+
+    grid, rows, totals = sweep(*args.bbox, args.step, args.zoom, CLASS_SETS[args.classes], args.parallelism,
+                               on_cell=on_cell)
+    print()
+    write_rows(args.output, rows)
+    if args.grid:
+        np.save(args.grid, grid)
+    print(f"Cells: {totals['cells']} ({totals['failed']} failed), {totals['cells_per_minute']:.1f} cells/min")
+    print(f"Total CO₂ Absorption: {totals['total_absorption']:.2f} kg")
+    print(f"Trees Needed: {totals['trees_needed_min']:.2f} - {totals['trees_needed_max']:.2f}")
+    print(f"results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+import random
+
+import numpy as np
+import pytest
+
+from SmartAfforestation.smart_afforestation import TreePlanterGA
+
+@pytest.mark.parametrize('encoding', ['binary', 'count'])
+def test_delta_fitness_matches_full_evaluation(encoding):
+    # tree weights are integral, so the incremental totals must match summing them up exactly
+    random.seed(0)
+    agent = TreePlanterGA(250, 300, 60000, 500, encoding=encoding)
+    generations = []
+
+    def on_generation(generation, best_fit):
+        expected = TreePlanterGA.get_batch_fitness(agent.chromosomes, agent.gene_weights, agent.cost_limit,
+                                                   agent.area_limit, agent.population)
+        assert agent.total_fit == expected
+        generations.append(generation)
+
+    # a small max_rep restarts the population every few generations, so fresh chromosomes are summed too
+    agent.run_search(runtime=0.5, max_rep=3, verbose=0, evaluation='delta', on_generation=on_generation)
+    assert len(generations) > 20
+    assert agent.best_fit == TreePlanterGA.get_batch_fitness([agent.best_chromosome], agent.gene_weights,
+                                                             agent.cost_limit, agent.area_limit, agent.population)[0]
+    assert np.isfinite(agent.best_fit)
@@ -0,0 +1,61 @@
+import random
+
+import numpy as np
+
+from SmartAfforestation.smart_afforestation import TreePlanterGA
+from SmartAfforestation.tree_data import load_tree_table
+
+COST_UNIT = 100  # every tree cost is a multiple of it
+
+def get_optimum(agent):
+    # best total score by dynamic programming over (cost, area) budgets, the bounded counts split
+    # into 1, 2, 4, ... copies so each copy is a 0/1 item
+    table = load_tree_table()
+    costs, areas, scores = table.cost//COST_UNIT, table.area, table.scores[agent.Zone]
+    best = np.zeros((agent.cost_limit//COST_UNIT + 1, agent.area_limit + 1))
+    for i, bound in enumerate(agent.bounds):
+        copies, n = [], 1
+        while bound > 0:
+            copies.append(min(n, bound))
+            bound -= copies[-1]
+            n *= 2
+        for n in copies:
+            cost, area = n*int(costs[i]), n*int(areas[i])
+            if cost < best.shape[0] and area < best.shape[1]:
+                best[cost:, area:] = np.maximum(best[cost:, area:], best[:-cost, :-area] + n*scores[i])
+    return best[-1, -1]
+
+def test_exact_matches_dynamic_programming(monkeypatch):
+    rng = random.Random(0)
+    for _ in range(60):
+        AQI = rng.choice((40, 120, 180, 250, 350))
+        cost_limit, area_limit = COST_UNIT*rng.randint(15, 300), rng.randint(4, 400)
+        population = rng.randint(10, 1000)
+        agent = TreePlanterGA(AQI, area_limit, cost_limit, population, encoding='count')
+        optimum = get_optimum(agent)
+        agent.run_search(verbose=0, engine='exact')
+        assert agent.is_optimal and agent.stop_reason == 'optimal'
+        assert agent.upper_bound == optimum
+        counts = agent.get_tree_counts(agent.best_chromosome)
+        assert sum(n*c for n, c in zip(counts, agent.cost)) <= cost_limit
+        assert sum(n*a for n, a in zip(counts, agent.area)) <= area_limit
+        assert sum(n*s for n, s in zip(counts, agent.score)) == optimum
+        assert agent.best_fit == 100*optimum/population
+
+        # out of nodes the search reports the root relaxation, which bounds every solution from above
+        with monkeypatch.context() as patch:
+            patch.setattr(TreePlanterGA, 'exact_max_nodes', 1)
+            agent = TreePlanterGA(AQI, area_limit, cost_limit, population, encoding='count')
+            agent.run_search(verbose=0, engine='exact')
+        assert agent.upper_bound >= optimum
+        assert agent.get_results()['gap'] >= 0
+
+def test_exact_binary_encoding_agrees():
+    rng = random.Random(1)
+    for _ in range(10):
+        args = (rng.choice((40, 180, 350)), rng.randint(4, 200), COST_UNIT*rng.randint(15, 150), 100)
+        binary, count = TreePlanterGA(*args, encoding='binary'), TreePlanterGA(*args, encoding='count')
+        binary.run_search(verbose=0, engine='exact')
+        count.run_search(verbose=0, engine='exact')
+        assert binary.best_fit == count.best_fit
+        assert binary.get_results()['score'] == count.get_results()['score']
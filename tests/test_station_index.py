@@ -0,0 +1,72 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Carbon_neutrality',
+                                'renewable'))
+
+from hydropower import RESERVOIR_COLUMNS, STATION_COLUMNS, StationIndex, haversine_km
+
+def get_stations(rng, n):
+    # stations spread over the globe with clusters across the antimeridian and around both poles
+    lats = np.concatenate([rng.uniform(-90, 90, n), rng.uniform(-30, 30, n), rng.uniform(80, 90, n),
+                           rng.uniform(-90, -80, n)])
+    lons = np.concatenate([rng.uniform(-180, 180, n), rng.choice((-1, 1), n)*rng.uniform(175, 180, n),
+                           rng.uniform(-180, 180, 2*n)])
+    rows = len(lats)
+    second = rng.permutation(rows)
+    data = pd.DataFrame({
+        'Hydropower Station Name': ['station %d' % i for i in range(rows)],
+        RESERVOIR_COLUMNS[0]: lats, RESERVOIR_COLUMNS[1]: lons,
+        STATION_COLUMNS[0][0]: lats, STATION_COLUMNS[0][1]: lons,
+        STATION_COLUMNS[1][0]: lats[second], STATION_COLUMNS[1][1]: lons[second],
+        'WaterHeadhgt( max)': rng.uniform(10, 200, rows), 'Res_capacityMm3': rng.uniform(0, 1000, rows)})
+    # some rows without a second station, some without reservoir coordinates so neither station counts
+    data.loc[rng.random(rows) < 0.3, list(STATION_COLUMNS[1])] = np.nan
+    data.loc[rng.random(rows) < 0.05, RESERVOIR_COLUMNS[0]] = np.nan
+    return data
+
+def get_distances(data, latitude, longitude):
+    # distance of every row's nearer station by a full scan, inf for rows that are not indexed
+    distances = np.fmin(*[haversine_km(latitude, longitude, data[lat].to_numpy(), data[lon].to_numpy())
+                          for lat, lon in STATION_COLUMNS])
+    distances[data[list(RESERVOIR_COLUMNS)].isna().any(axis=1).to_numpy()] = np.nan
+    return np.where(np.isnan(distances), np.inf, distances)
+
+def get_queries(rng, n):
+    # anywhere, across the antimeridian, and near or at the poles
+    lats = np.concatenate([rng.uniform(-90, 90, n), rng.uniform(-30, 30, n), rng.uniform(85, 90, n),
+                           rng.uniform(-90, -85, n), [90, -90, 0, 0]])
+    lons = np.concatenate([rng.uniform(-180, 180, n), rng.choice((-1, 1), n)*rng.uniform(178, 180, n),
+                           rng.uniform(-180, 180, 2*n), [0, 180, 180, -180]])
+    return zip(lats.tolist(), lons.tolist())
+
+def test_query_radius_matches_full_scan():
+    rng = np.random.default_rng(0)
+    data = get_stations(rng, 200)
+    for cell_deg in (1.0, 7.5):
+        index = StationIndex(data, cell_deg)
+        for latitude, longitude in get_queries(rng, 25):
+            for radius_km in (50, 400, 3000, 25000):
+                distances = get_distances(data, latitude, longitude)
+                expected = np.flatnonzero(distances <= radius_km)
+                rows, found = index.query_radius(latitude, longitude, radius_km)
+                assert sorted(rows.tolist()) == expected.tolist()
+                np.testing.assert_allclose(found, distances[rows])
+                assert np.all(np.diff(found) >= 0)
+
+def test_query_nearest_matches_full_scan():
+    rng = np.random.default_rng(1)
+    data = get_stations(rng, 200)
+    index = StationIndex(data)
+    for latitude, longitude in get_queries(rng, 25):
+        distances = get_distances(data, latitude, longitude)
+        for k in (1, 5, 40):
+            rows, found = index.query_nearest(latitude, longitude, k)
+            np.testing.assert_allclose(found, np.sort(distances)[:k])
+            np.testing.assert_allclose(distances[rows], found)
+    # asking for more rows than are indexed returns all of them
+    rows, _ = index.query_nearest(0, 0, len(data))
+    assert len(rows) == np.isfinite(get_distances(data, 0, 0)).sum()